@@ -0,0 +1,435 @@
+# -*- coding: utf-8-*-
+"""Micro benchmarks
+
+python benchmark.py            # run all
+python benchmark.py bookmeta   # run some
+
+"""
+import os
+import sys
+import time
+import random
+import string
+import hashlib
+
+
+def fake_docs(n, seed=0):
+    """n book documents shaped like the ones in db.book"""
+    rnd = random.Random(seed)
+    words = [''.join(rnd.choice(string.ascii_lowercase) for i in range(rnd.randint(3, 9)))
+             for j in range(2000)]
+    docs = []
+    for i in range(n):
+        docs.append({'_id': os.urandom(12),  # ObjectId
+                     'md5': unicode(hashlib.md5(str(i)).hexdigest()),
+                     'ext': u'.pdf',
+                     'bytes': rnd.randint(10000, 50000000),
+                     'language': rnd.choice([u'', u'en', u'zh', u'de']),
+                     'rawname': [u' '.join(rnd.choice(words) for k in range(rnd.randint(2, 6)))],
+                     })
+    return docs
+
+
+def deep_size(objs):
+    """bytes held by objs and everything they reference, each object counted once"""
+    seen = set()
+    stack = list(objs)
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.iterkeys())
+            stack.extend(obj.itervalues())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            stack.extend(getattr(obj, '__dict__', {}).itervalues())
+            for slot in getattr(type(obj), '__slots__', ()):
+                if hasattr(obj, slot):
+                    stack.append(getattr(obj, slot))
+    return total
+
+
+def report(name, seconds, n, unit='op'):
+    print '%-40s %10.3f ms %10.3f us/%s' % (name, seconds * 1000, seconds * 1e6 / n, unit)
+
+
+#----------------------------------------------------------------------------
+
+class LegacyBookMeta:
+    """BookMeta before it got __slots__, keeping the whole db document"""
+
+    def __init__(self, meta):
+        self.meta = meta
+        self.md5 = meta['md5']
+        self.ext = meta['ext']
+
+
+def bench_bookmeta(n=100000):
+    """per-book memory of BookMeta against the dict-backed one"""
+    from media_repo import BookMeta
+    docs = fake_docs(n)
+
+    start = time.time()
+    legacy = [LegacyBookMeta(dict(doc)) for doc in docs]
+    report('LegacyBookMeta build', time.time() - start, n, 'book')
+    start = time.time()
+    compact = [BookMeta(doc) for doc in docs]
+    report('BookMeta build', time.time() - start, n, 'book')
+
+    legacy_size = deep_size(legacy) - deep_size([])
+    compact_size = deep_size(compact) - deep_size([])
+    print '%-40s %10d bytes/book' % ('LegacyBookMeta', legacy_size / n)
+    print '%-40s %10d bytes/book' % ('BookMeta', compact_size / n)
+    print '%-40s %10.1fx' % ('reduction', float(legacy_size) / compact_size)
+
+
+#----------------------------------------------------------------------------
+
+def bench_search(n=100000):
+    """overview search box: indexed search against the linear TextSearch scan"""
+    from media_repo import BookMeta
+    from frame_overview import book_index
+    from lib.search_index import IndexFilter
+    books = [BookMeta(doc) for doc in fake_docs(n)]
+    queries = ['ab', 'abc', 'qxz', books[n / 2].rawname[:8], books[7].md5[:6]]
+
+    def scan(text):
+        text = text.lower()
+        return [x for x in books
+                if text in x.get_dispname().lower() or text in x.rawname.lower()
+                or text in x.language.lower() or x.md5.startswith(text)]
+
+    start = time.time()
+    index = book_index()
+    index.Add(books)
+    report('SearchIndex build', time.time() - start, n, 'book')
+    search = IndexFilter(index)
+    for text in queries:
+        search.SetText(text)
+        start = time.time()
+        found = search(books)
+        indexed = time.time() - start
+        start = time.time()
+        expected = scan(text)
+        scanned = time.time() - start
+        assert found == expected, text
+        report('scan %r (%d hits)' % (text, len(found)), scanned, 1, 'query')
+        report('index %r' % text, indexed, 1, 'query')
+
+
+#----------------------------------------------------------------------------
+
+class _ReportView(object):
+    """just enough of an ObjectListView for filters and columns"""
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def InReportView(self):
+        return True
+
+
+def bench_refine(n=100000):
+    """TextSearch per keystroke, refining the last matches against searching all books"""
+    from media_repo import BookMeta
+    from frame_overview import cols
+    from lib.ObjectListView import Filter
+    books = [BookMeta(doc) for doc in fake_docs(n)]
+    olv = _ReportView([cols[k] for k in ('title', 'size', 'language', 'md5')])
+    word = books[n / 2].rawname.split()[0]
+    full = Filter.TextSearch(olv, olv.columns)
+    refining = Filter.TextSearch(olv, olv.columns)
+
+    for i in range(1, len(word) + 1):
+        full.Reset()
+        full.SetText(word[:i])
+        start = time.time()
+        expected = full(books)
+        report('full %r (%d hits)' % (word[:i], len(expected)), time.time() - start, 1, 'key')
+        refining.SetText(word[:i])
+        start = time.time()
+        found = refining(books)
+        report('refine %r' % word[:i], time.time() - start, 1, 'key')
+        assert found == expected
+
+
+def bench_searchkeys(n=100000):
+    """TextSearch over cached search keys against converting every value per search"""
+    from media_repo import BookMeta
+    from frame_overview import cols
+    from lib.ObjectListView import Filter
+    books = [BookMeta(doc) for doc in fake_docs(n)]
+    olv = _ReportView([cols[k] for k in ('title', 'size', 'language', 'md5')])
+    queries = ['ab', 'mb', 'zh', books[n / 2].rawname[:5]]
+
+    def convert_each_time(text):
+        return [x for x in books
+                if any(text in col.GetStringValue(x).lower() for col in olv.columns)]
+
+    search = Filter.TextSearch(olv, olv.columns)
+    for col in olv.columns:
+        col.ForgetKeys()
+    start = time.time()
+    search.SetText(queries[0])
+    search(books)
+    report('first search, caching keys', time.time() - start, n, 'book')
+
+    for text in queries:
+        start = time.time()
+        expected = convert_each_time(text)
+        report('convert %r (%d hits)' % (text, len(expected)), time.time() - start, n, 'book')
+        search.Reset()
+        search.SetText(text)
+        start = time.time()
+        found = search(books)
+        report('cached keys %r' % text, time.time() - start, n, 'book')
+        assert found == expected
+
+
+def bench_accessors(n=100000):
+    """per-cell cost of ColumnDefn.GetValue with compiled accessors against _Munge reflection"""
+    from media_repo import BookMeta
+    from frame_overview import cols
+    books = [BookMeta(doc) for doc in fake_docs(n)]
+
+    for name in ('title', 'size', 'language', 'md5'):
+        col = cols[name]
+        munger = col.valueGetter
+
+        def reflect(x):  # GetValue before accessors
+            return col._MungeGenerically(x, munger)
+
+        start = time.time()
+        expected = [reflect(x) for x in books]
+        report('%s reflection' % name, time.time() - start, n, 'cell')
+        col.GetValue(books[0])  # compile the accessor
+        start = time.time()
+        found = [col.GetValue(x) for x in books]
+        report('%s accessor' % name, time.time() - start, n, 'cell')
+        assert found == expected
+
+
+def bench_sort(n=100000):
+    """column-click sort: cmp with strcoll per comparison against cached locale keys"""
+    import locale
+    from media_repo import BookMeta
+    from frame_overview import cols
+    try:
+        locale.setlocale(locale.LC_ALL, '')
+    except locale.Error:
+        pass  # stay with the C locale
+    books = [BookMeta(doc) for doc in fake_docs(n)]
+    col = cols['title']
+
+    def compare(object1, object2):  # _SortItemsNow before keys
+        value1 = col.GetValue(object1)
+        value2 = col.GetValue(object2)
+        try:
+            return locale.strcoll(value1.lower(), value2.lower())
+        except:
+            return cmp(value1, value2)
+
+    start = time.time()
+    expected = sorted(books, cmp=compare)
+    report('cmp with strcoll', time.time() - start, n, 'row')
+
+    col.ForgetKeys()
+    start = time.time()
+    found = sorted(books, key=col.GetSortKey)
+    report('keys, first sort', time.time() - start, n, 'row')
+    start = time.time()
+    found = sorted(books, key=col.GetSortKey, reverse=True)
+    report('keys, cached', time.time() - start, n, 'row')
+    assert [col.GetSortKey(x) for x in reversed(found)] == [col.GetSortKey(x) for x in expected]
+
+    # what SortListItemsByKey leaves for the control to do
+    positions = range(n)
+    random.shuffle(positions)
+    start = time.time()
+    sorted(range(n), cmp=lambda key1, key2: positions[key1] - positions[key2])
+    report('SortItems by positions', time.time() - start, n, 'row')
+
+
+def bench_remove(n=200000, k=10):
+    """deleting k books in place against repopulating the whole list, as RemoveObjects used to"""
+    import wx
+    from media_repo import BookMeta
+    from frame_overview import cols
+    from lib.ObjectListView import ObjectListView, FastObjectListView
+    app = wx.App(False)
+    frame = wx.Frame(None)
+    books = [BookMeta(doc) for doc in fake_docs(n)]
+    victims = random.Random(1).sample(books, k)
+
+    for cls in (FastObjectListView, ObjectListView):
+        olv = cls(frame, style=wx.LC_REPORT)
+        olv.SetColumns([cols[name] for name in ('title', 'size', 'language', 'md5')])
+        olv.SetObjects(books)
+        before = olv.GetObjects()[:]
+        start = time.time()
+        olv.RepopulateList()
+        report('%s repopulate' % cls.__name__, time.time() - start, n, 'row')
+        start = time.time()
+        olv.RemoveObjects(victims)
+        report('%s remove %d' % (cls.__name__, k), time.time() - start, k, 'row')
+        gone = set(victims)
+        assert olv.GetObjects() == [x for x in before if x not in gone]
+        assert olv.GetItemCount() == n - k
+        olv.Destroy()
+    frame.Destroy()
+
+
+def bench_groups(n=100000, k=1000, batch=10):
+    """streaming books into a view grouped by initial letter: in their groups against regrouping"""
+    import wx
+    from media_repo import BookMeta
+    from frame_overview import cols
+    from lib.ObjectListView import ColumnDefn, FastObjectListView, GroupListView
+    app = wx.App(False)
+    frame = wx.Frame(None)
+    docs = fake_docs(n + k)
+    books = [BookMeta(doc) for doc in docs[:n]]
+    streamed = [BookMeta(doc) for doc in docs[n:]]
+    batches = [streamed[i:i + batch] for i in range(0, k, batch)]
+    title = ColumnDefn("Title", "left", 330, "get_dispname", useInitialLetterForGroupKey=True)
+
+    def regroup(olv, x):  # GroupListView.AddObjects before groups were kept
+        olv.groups = None
+        FastObjectListView.AddObjects(olv, x)
+
+    results = []
+    for (name, add) in [('regroup', regroup), ('in place', GroupListView.AddObjects)]:
+        olv = GroupListView(frame, style=wx.LC_REPORT)
+        olv.SetColumns([title] + [cols[key] for key in ('size', 'language', 'md5')])
+        olv.SortBy(1)
+        olv.SetObjects(books)
+        start = time.time()
+        for x in batches:
+            add(olv, x)
+        report('%s, %d books in %d batches' % (name, k, len(batches)), time.time() - start, k, 'book')
+        results.append([(x.key, len(x.modelObjects)) for x in olv.groups])
+        olv.Destroy()
+    assert results[0] == results[1]
+    frame.Destroy()
+
+
+def bench_autosize(n=200000):
+    """autosizing a column: the control measuring every row against measuring a sample"""
+    import wx
+    from media_repo import BookMeta
+    from lib.ObjectListView import ColumnDefn, FastObjectListView
+    app = wx.App(False)
+    frame = wx.Frame(None)
+    books = [BookMeta(doc) for doc in fake_docs(n)]
+    olv = FastObjectListView(frame, style=wx.LC_REPORT)
+    olv.SetColumns([ColumnDefn("Title", "left", wx.LIST_AUTOSIZE, "get_dispname")])
+    olv.SetObjects(books)
+
+    start = time.time()
+    olv.SetColumnWidth(0, wx.LIST_AUTOSIZE)  # AutoSizeColumns before sampling
+    report('measure every row', time.time() - start, n, 'row')
+    exact = olv.GetColumnWidth(0)
+    olv.SetColumnWidth(0, 0)  # so the sampled width is set
+    start = time.time()
+    olv.AutoSizeColumns()
+    report('sample, first time', time.time() - start, n, 'row')
+    start = time.time()
+    olv.AutoSizeColumns()
+    report('sample, again', time.time() - start, n, 'row')
+    print '%-40s %10d px, sampled %d px' % ('width', exact, olv.GetColumnWidth(0))
+    olv.Destroy()
+    frame.Destroy()
+
+
+def bench_grouprows(n=200000, g=5000):
+    """collapse and expand all of g groups: updating group row offsets against flattening the rows,
+    then look up rows and the rows of objects"""
+    from lib.ObjectListView.ObjectListView import ListGroup, _GroupRows
+    groups = [ListGroup(i, str(i)) for i in range(g)]
+    for i in range(n):
+        groups[i % g].modelObjects.append(i)
+
+    def flatten():  # GroupListView._BuildInnerList before _GroupRows
+        rows = []
+        for group in groups:
+            if rows:
+                rows.append(None)
+            rows.append(group)
+            if group.isExpanded:
+                rows.extend(group.modelObjects)
+        return rows
+
+    rows = _GroupRows(groups)
+    for expanded in (False, True):
+        for group in groups:
+            group.isExpanded = expanded
+        start = time.time()
+        flat = flatten()
+        report('flatten, expanded=%s' % expanded, time.time() - start, g, 'group')
+        start = time.time()
+        rows.Update(groups)
+        report('offsets, expanded=%s' % expanded, time.time() - start, g, 'group')
+        assert len(rows) == len(flat)
+
+    indices = [random.randrange(len(flat)) for i in range(10000)]
+    start = time.time()
+    found = [rows[i] for i in indices]
+    report('row lookup', time.time() - start, len(indices), 'row')
+    assert found == [flat[i] for i in indices]
+
+    models = random.sample(range(n), 10000)
+    start = time.time()
+    rows.GetGroupOf(0)
+    report('object maps', time.time() - start, n, 'object')
+    start = time.time()
+    found = [rows.GetIndexOf(x) for x in models]
+    report('object row lookup', time.time() - start, len(models), 'object')
+    assert [flat[i] for i in found] == models
+
+
+def bench_typeahead(n=500000):
+    """typing into an unsorted list: the sorted search key index against scanning the rows"""
+    from media_repo import BookMeta
+    from frame_overview import cols
+    from lib.ObjectListView.ObjectListView import _SearchKeyIndex
+    books = [BookMeta(doc) for doc in fake_docs(n)]
+    rows = dict((x, i) for (i, x) in enumerate(books))
+    start = n / 2
+
+    for name in ('title', 'md5'):
+        col = cols[name]
+        prefix = col.GetSearchKey(books[n / 3])[:4]
+        for x in books:  # both ways cache the keys on first use
+            col.GetSearchKey(x)
+
+        def scan():  # _FindByTyping without an index, were it allowed above MAX_ROWS_FOR_UNSORTED_SEARCH
+            for i in range(start, n) + range(0, start):
+                if col.GetSearchKey(books[i]).startswith(prefix):
+                    return i
+
+        t0 = time.time()
+        expected = scan()
+        report('%s scan %r' % (name, prefix), time.time() - t0, 1, 'key')
+        t0 = time.time()
+        index = _SearchKeyIndex(col)
+        index.Add(books)
+        list(index.Find(prefix))
+        report('%s index build, first search' % name, time.time() - t0, n, 'book')
+        t0 = time.time()
+        found = [rows[x] for x in index.Find(prefix)]
+        report('%s index %r (%d hits)' % (name, prefix, len(found)), time.time() - t0, 1, 'key')
+        assert min([i for i in found if i >= start] or found) == expected
+
+
+#----------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or sorted(k[6:] for k in globals() if k.startswith('bench_'))
+    for name in names:
+        print '== %s' % name
+        globals()['bench_' + name]()
@@ -6,18 +6,157 @@ Required: MediaRepo
 
 """
 import wx
-from lib.ObjectListView import ObjectListView, ColumnDefn
-from lib.ObjectListView import Filter
+import collections
+import io
+import threading
+from lib.ObjectListView import ObjectListView, VirtualObjectListView, FastObjectListView
+from lib.ObjectListView import ColumnDefn, BatchedUpdate
+from lib.ObjectListView import EVT_CELL_EDIT_FINISHED
+from lib.ObjectListView import Export
+from lib.search_index import SearchIndex, IndexFilter
+from lib.search_scheduler import SearchScheduler, QueryScheduler
 import lib.util as util
 import subprocess
+import settings
+from frame_scan import ScanFrame
+from media_repo import BookMeta
 
 showlist = ['title', 'language', 'size', 'md5']
-cols = {'title': ColumnDefn("Title", "left", 330, "get_dispname", stringConverter='%s', valueSetter='set_dispname'),
-        'language': ColumnDefn("Language", "center", 80, "get_book_language", stringConverter='%s', isEditable=False),
+cols = {'title': ColumnDefn("Title", "left", 330, "get_dispname", stringConverter='%s', valueSetter='set_dispname',
+                            useSearchIndex=True),
+        'language': ColumnDefn("Language", "center", 80, "get_book_language", stringConverter='%s', isEditable=False,
+                               useSearchIndex=True),
         'size': ColumnDefn("Size", "right", 80, "getSizeString", stringConverter='%s', isEditable=False),
-        'md5': ColumnDefn("MD5", "center", 320, "md5", stringConverter='%s', isEditable=False),
+        'md5': ColumnDefn("MD5", "center", 320, "md5", stringConverter='%s', isEditable=False, useSearchIndex=True),
         }
 
+
+def book_index():
+    """search index over title, raw names, language and md5 of books"""
+    return SearchIndex([lambda book: book.get_dispname(),
+                        lambda book: book.rawname,
+                        lambda book: book.language],
+                       [lambda book: book.md5])
+
+
+class BookListView(FastObjectListView):
+    """virtual list of books, rendering rows as they are shown
+
+    wx asks for every cell of a row, and for the same rows again on each
+    scroll or repaint, so the text of the latest settings.row_cache rows
+    is kept (LRU). a row is rendered again once its book is refreshed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.rows = collections.OrderedDict()  # book -> text per column
+        FastObjectListView.__init__(self, *args, **kwargs)
+
+    def OnGetItemText(self, itemIdx, colIdx):
+        book = self.GetObjectAt(itemIdx)
+        row = self.rows.pop(book, None)
+        if row is None:
+            row = [self.GetStringValueAt(book, i) for i in range(len(self.columns))]
+            if len(self.rows) >= settings.row_cache:
+                self.rows.popitem(last=False)
+        self.rows[book] = row  # most recently used last
+        return row[colIdx]
+
+    def SetColumns(self, columns, repopulate=True):
+        self.rows.clear()
+        FastObjectListView.SetColumns(self, columns, repopulate)
+
+    def _ForgetKeys(self, modelObjects=None):
+        """forget the rendered rows of books whose values may have changed"""
+        FastObjectListView._ForgetKeys(self, modelObjects)
+        if modelObjects is None:
+            self.rows.clear()
+        else:
+            for book in modelObjects:
+                self.rows.pop(book, None)
+
+
+class LiveFeed(object):
+    """books found by scans, added to the overview as they are stored
+
+    scan threads call book_found(); books already listed or waiting are
+    skipped by md5, and at most settings.live_queue_size of them wait.
+    while a scan runs, a timer on the UI thread adds the waiting books in
+    a batch through a BatchedUpdate, whose period is stretched so that
+    adding books takes at most settings.live_frame_budget of the time.
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.olv = BatchedUpdate(frame.myOlv, settings.live_period_min)
+        self.lock = threading.Lock()
+        self.pending = collections.OrderedDict()  # md5 -> file meta
+        self.known = set()  # md5 of books listed or waiting
+        if frame.pager is None:
+            self.known.update(book.md5 for book in frame.myOlv.GetObjects())
+        self.overflowed = False
+        self.scans = 0
+        self.timer = None
+
+    def books_listed(self, books):
+        """the list was given these books anew"""
+        with self.lock:
+            self.known = set(book.md5 for book in books)
+            self.known.update(self.pending)
+
+    def books_removed(self, books):
+        with self.lock:
+            self.known.difference_update(book.md5 for book in books)
+
+    def book_found(self, file_meta):
+        """called on scan threads"""
+        md5 = file_meta['md5']
+        with self.lock:
+            if md5 in self.known:
+                return
+            if len(self.pending) >= settings.live_queue_size:
+                self.overflowed = True
+                return
+            self.known.add(md5)
+            self.pending[md5] = file_meta
+
+    def scan_started(self):
+        self.scans += 1
+        if self.timer is None:
+            self.timer = wx.CallLater(int(self.olv.updatePeriod * 1000), self.tick)
+
+    def scan_stopped(self):
+        self.scans -= 1
+        if self.scans > 0:
+            return
+        if self.timer is not None:
+            self.timer.Stop()
+            self.timer = None
+        # stored books are all in db by now
+        if self.overflowed or self.frame.pager is not None:
+            with self.lock:
+                self.pending.clear()
+                self.overflowed = False
+            self.frame.ReloadBooks(self.olv)
+        else:
+            self.add_pending()
+
+    def tick(self):
+        """add the waiting books, then wait in proportion to how long it took"""
+        self.add_pending()
+        period = self.olv.lastApplyDuration / settings.live_frame_budget
+        self.olv.updatePeriod = min(max(period, settings.live_period_min), settings.live_period_max)
+        self.timer = wx.CallLater(int(self.olv.updatePeriod * 1000), self.tick)
+
+    def add_pending(self):
+        with self.lock:
+            metas = self.pending.values()
+            self.pending = collections.OrderedDict()
+        if metas and self.frame.pager is None:  # paged lists are reloaded at the end
+            books = [BookMeta(meta) for meta in metas]
+            self.frame.myOlv.GetFilter().AddObjects(books)
+            self.olv.AddObjects(books)
+
+
 class OverViewFrame(wx.Frame):
     def __init__(self, repo):
         FrameStyle = wx.CAPTION | wx.RESIZE_BORDER | wx.SYSTEM_MENU |\
@@ -25,28 +164,51 @@ class OverViewFrame(wx.Frame):
         wx.Frame.__init__(self, parent=None, id=-1, title="BookHub",
                           pos=(100, 100), size=(500, 600), style=FrameStyle)
 
+        # big libraries are paged in from db as rows are shown
+        self.pager = None
+        self.feed = None  # created with the scan window
+        if repo.count_books() > settings.lazy_booklist_min:
+            self.pager = repo.get_bookpager()
+
         self.BuildUI()
         self.InitObjectListView(repo)
         self.InitSearchCtrls()
 
     def BuildUI(self):
         self.SearchFile = wx.SearchCtrl(self)
-        self.myOlv = ObjectListView(self, -1,
-                                    style=wx.LC_REPORT | wx.SUNKEN_BORDER)
+        self.scanBtn = wx.Button(self, label="Scan")
+        if self.pager is None and settings.fast_booklist:
+            self.myOlv = BookListView(self, -1,
+                                      style=wx.LC_REPORT | wx.SUNKEN_BORDER)
+        elif self.pager is None:
+            self.myOlv = ObjectListView(self, -1,
+                                        style=wx.LC_REPORT | wx.SUNKEN_BORDER)
+        else:
+            self.myOlv = VirtualObjectListView(self, -1,
+                                               style=wx.LC_REPORT | wx.SUNKEN_BORDER)
+        size_tool = wx.BoxSizer(wx.HORIZONTAL)
+        size_tool.Add(self.SearchFile, 1, wx.ALL | wx.EXPAND, 2)
+        size_tool.Add(self.scanBtn, 0, wx.ALL | wx.EXPAND, 2)
         size_main = wx.BoxSizer(wx.VERTICAL)
-        size_main.Add(self.SearchFile, 1, wx.ALL | wx.EXPAND, 2)
+        size_main.Add(size_tool, 1, wx.ALL | wx.EXPAND, 0)
         size_main.Add(self.myOlv, 20, wx.ALL | wx.EXPAND, 4)
         self.SetSizer(size_main)
+        self.CreateStatusBar()
         self.Layout()
         self.CenterOnScreen()
 
         self.myOlv.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.OnOpenFile)
         self.myOlv.Bind(wx.EVT_LIST_KEY_DOWN, self.OnKeyDown)
+        self.scanBtn.Bind(wx.EVT_BUTTON, self.OnScan)
 
     def InitObjectListView(self, repo):
         self.repo = repo
         self.myOlv.SetColumns([cols[k.lower()] for k in showlist])
-        self.myOlv.SetObjects(self.repo.get_booklist())
+        if self.pager is None:
+            self.myOlv.SetObjects(self.repo.get_booklist())
+        else:
+            self.myOlv.SetObjectGetter(self.pager.__getitem__)
+            self.myOlv.SetItemCount(len(self.pager))
         self.myOlv.cellEditMode = ObjectListView.CELLEDIT_SINGLECLICK
 
     def InitSearchCtrls(self):
@@ -62,7 +224,39 @@ class OverViewFrame(wx.Frame):
             searchCtrl.Bind(wx.EVT_TEXT, _handleText)
             searchCtrl.Bind(wx.EVT_SEARCHCTRL_CANCEL_BTN, _handleCancel)
             searchCtrl.SetFocus()
-            olv.SetFilter(Filter.TextSearch(olv, olv.columns[0:4]))
+            olv.SetFilter(IndexFilter(book_index()))
+            if self.pager is None:
+                olv.GetFilter().AddObjects(olv.GetObjects())
+            olv.Bind(EVT_CELL_EDIT_FINISHED, self.OnCellEditFinished)
+        if self.pager is None:
+            self.searcher = SearchScheduler(self.myOlv.GetFilter().Matcher, self.OnSearchDone,
+                                            settings.search_delay, settings.search_chunk)
+        else:  # db does the search, on the worker thread too
+            self.searcher = QueryScheduler(lambda text: self.pager.searched(text),
+                                           self.OnPagerSearchDone, settings.search_delay)
+        self.Bind(wx.EVT_CLOSE, self.OnClose)
+
+    def ReloadBooks(self, olv=None):
+        """list the books in db again
+
+        @olv: the list, or a BatchedUpdate of it"""
+        if self.pager is None:
+            books = self.repo.get_booklist()
+            self.myOlv.GetFilter().Clear()
+            self.myOlv.GetFilter().AddObjects(books)
+            (olv or self.myOlv).SetObjects(books)
+            if self.feed is not None:
+                self.feed.books_listed(books)
+        else:
+            self.pager.set_query(self.pager.query)
+            self.myOlv.SetItemCount(len(self.pager))
+            self.myOlv.RefreshObjects()
+
+    def OnScan(self, event):
+        if self.feed is None:
+            self.feed = LiveFeed(self)
+        frame = ScanFrame(self.feed)
+        frame.Show()
 
     def OnOpenFile(self, event):
         obj = self.myOlv.GetSelectedObject()
@@ -76,45 +270,83 @@ class OverViewFrame(wx.Frame):
             wx.MessageBox('Open File Error. returncode %s' % res, 'Bookhub Message')
 
     def OnKeyDown(self, event):
-        objs = self.myOlv.GetSelectedObjects()
         key = event.GetKeyCode()
         if wx.WXK_DELETE == key:
-            self.DoDelete(objs)
+            self.DoDelete(self.myOlv.GetSelectedObjects())
         elif 3 == key:  # wx.WXK_CONTROL_C
-            self.DoCopyFileid(objs)
+            self.DoCopyFileid(self.myOlv.YieldSelectedObjects())
 
     def DoDelete(self, objs):
         for obj in objs:
             pass
             # obj.delete()
         self.myOlv.RemoveObjects(objs)
+        if self.pager is None:
+            self.myOlv.GetFilter().RemoveObjects(objs)
+        if self.feed is not None:
+            self.feed.books_removed(objs)
+
+    def OnCellEditFinished(self, event):
+        event.Skip()
+        if self.pager is None and not event.userCancelled:
+            self.myOlv.GetFilter().RefreshObjects([event.rowModel])
 
     def DoCopyFileid(self, objs):
-        self.dataObj = wx.TextDataObject()
-        file_ids = ','.join([obj.file_id for obj in objs])
-        wx.MessageBox(file_ids, "MD5 code")
-        # self.dataObj.SetText(file_ids)
-        # if wx.TheClipboard.Open():
-        #   wx.TheClipboard.SetData(self.dataObj)
-        #    wx.TheClipboard.Close()
-        #else:
-        #    wx.MessageBox("Unable to open the clipboard", "Error")
+        """copy the md5 of each book to the clipboard, one per line, as objs yields them"""
+        sink = io.StringIO()
+        Export.WriteTabSeparated(([obj.md5] for obj in objs), sink)
+        md5s = sink.getvalue()
+        if not md5s:
+            return
+        if wx.TheClipboard.Open():
+            wx.TheClipboard.SetData(wx.TextDataObject(md5s))
+            wx.TheClipboard.Close()
+            self.SetStatusText("%d MD5 codes copied" % md5s.count('\n'))
+        else:
+            wx.MessageBox("Unable to open the clipboard", "Error")
 
     def OnTextSearchCtrl(self, event, searchCtrl, olv):
         searchCtrl.ShowCancelButton(len(searchCtrl.GetValue()))
-        olv.GetFilter().SetText(searchCtrl.GetValue())
+        if self.pager is not None:  # let db do the search, see OnPagerSearchDone
+            self.searcher.search(searchCtrl.GetValue())
+            return
+        if searchCtrl.GetValue():  # search in background, see OnSearchDone
+            self.searcher.search(searchCtrl.GetValue(), olv.GetObjects())
+            return
+        self.searcher.cancel()
+        olv.GetFilter().SetText("")
         olv.RepopulateList()
+        self.SetStatusText("")
+
+    def OnSearchDone(self, text, matches, seconds):
+        self.myOlv.GetFilter().SetResult(text, self.myOlv.GetObjects(), matches)
+        self.myOlv.RepopulateList()
+        self.SetStatusText("%d books found in %.0f ms" % (len(matches), seconds * 1000))
+
+    def OnPagerSearchDone(self, text, pager, seconds):
+        self.pager = pager
+        self.myOlv.SetObjectGetter(pager.__getitem__)
+        self.myOlv.SetItemCount(len(pager))
+        self.myOlv.RefreshObjects()
+        if text:
+            self.SetStatusText("%d books found in %.0f ms" % (len(pager), seconds * 1000))
+        else:
+            self.SetStatusText("")
 
     def OnCancelSearchCtrl(self, event, searchCtrl, olv):
         searchCtrl.SetValue("")
         self.OnTextSearchCtrl(event, searchCtrl, olv)
 
+    def OnClose(self, event):
+        self.searcher.stop()
+        event.Skip()
+
 
 class TestApp(wx.App):
 
     def OnInit(self):
-        from media_repo import MediaRepo
-        repo = MediaRepo()
+        from media_repo import get_repo
+        repo = get_repo()
         frame = OverViewFrame(repo)
         self.SetTopWindow(frame)
         frame.Show()
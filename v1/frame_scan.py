@@ -1,81 +1,271 @@
 #coding: utf-8
 import wx
 import threading
+import multiprocessing
+import Queue
 import os
 import settings
 import lib.util as util
-from media_repo import MediaRepo
-
-def add_file(src_path, file_meta):
-    repo = MediaRepo()
-    repo.add_bookinfo(file_meta)
-    repo.add_history(file_meta['md5'], src_path)
-    repo.add_file(src_path, file_meta)
-    return 1
-
+from lib.walker import Walker
+from lib import dedupe
+from media_repo import get_repo
 
 class FileScan(threading.Thread):
 
-    def __init__(self, tar_path, window):
+    def __init__(self, tar_path, window, force_rehash=False, listener=None):
         threading.Thread.__init__(self)
         self.stopFlag = False
-        self.ignore_seq = settings.ignore_seq or set()
-        self.ignore_hidden = settings.ignore_hidden
-        self.ext_pool = settings.ext_pool
+        self.walker = Walker(settings.ignore_seq, settings.ignore_hidden, settings.ext_pool)
+        self.force_rehash = force_rehash or settings.force_rehash
+        self.fingerprints = {}
 
-        self.file_hdlr = add_file
+        self.file_hdlr = None  # set to a bulk writer in run()
         self.tar_path = tar_path 
         self.window = window
+        self.listener = listener  # see ScanFrame
         self.cnt_scanned = 0
+        self.cnt_unique = 0  # files of unique size, see SizeFirstScan
 
     def stop(self):
         self.stopFlag = True
+        self.walker.stop()
 
     def run(self):
-        cnt_found = self.scan_path(self.tar_path)
-        wx.CallAfter(self.window.scan_stopped, self.tar_path, cnt_found, self.cnt_scanned)
+        cnt_found, error = 0, None
+        try:
+            cnt_found = self.scan()
+        except Exception as e:
+            error = e
+            raise  # the thread prints the traceback
+        finally:
+            # always reached, so the window and listener see the scan end
+            wx.CallAfter(self.window.scan_stopped, self.tar_path, cnt_found, self.cnt_scanned,
+                         self.cnt_unique, error)
+
+    def scan(self):
+        """scan tar_path into db, return count of target files found"""
+        repo = get_repo()
+        if self.force_rehash:
+            repo.invalidate_fingerprints(self.tar_path)
+        else:
+            self.fingerprints = repo.get_fingerprints(self.tar_path)
+        # the listener hears of books once they are in db, so they can be edited
+        on_stored = self.listener.book_found if self.listener is not None else None
+        writer = repo.bulk_writer(self.batch_written, on_stored)
+        self.file_hdlr = writer.add
+        try:
+            return self.scan_path(self.tar_path)
+        finally:
+            writer.close()
 
     def scan_path(self, src_path):
         """scan path to detect target files
 
         @src_path: unicode encoding is required"""
-        if not os.path.exists(src_path):  # not exists
-            return None
-
-        if os.path.isfile(src_path):  # file
-            rawname, ext = os.path.splitext(os.path.basename(src_path))
-            if not ext or ext not in self.ext_pool:  # file extension check
-                return 0
-            file_meta = {'rawname': [rawname],
-                         'ext': ext,
-                         'md5': util.md5_for_file(src_path),
-                         'bytes': os.path.getsize(src_path),
-                         }
-            wx.CallAfter(self.window.file_found, src_path, file_meta['md5'])
-            return self.file_hdlr(src_path, file_meta) or 0
-        else:  # dir
-            added = 0
-            # ignore log/.git etc
-            tar_path = set(os.listdir(src_path)) - self.ignore_seq
-            self.cnt_scanned += len(tar_path)
-            wx.CallAfter(self.window.file_scanned, self.cnt_scanned)
-            for rel_path in tar_path:
-                if self.stopFlag:
-                    return added
-                abs_path = os.path.join(src_path, rel_path)
-                if self.ignore_hidden and util.is_hiden(abs_path):
-                    continue  # ignore hidden
+        added = 0
+        for item in self.iter_path(src_path):
+            if self.stopFlag:
+                break
+            added += self.scan_file(*item)
+        return added
+
+    def scan_file(self, path, rawname, ext, fingerprint):
+        md5, changed = self.file_md5(path, fingerprint)
+        file_meta = self.file_meta(rawname, ext, md5, fingerprint)
+        return self.found(path, file_meta, fingerprint if changed else None)
+
+    def iter_path(self, src_path):
+        """yield (path, rawname, ext, fingerprint) of target files under src_path
+
+        @src_path: unicode encoding is required"""
+        return self.walker.walk(src_path, self.dir_scanned)
+
+    def batch_written(self, count, seconds):
+        wx.CallAfter(self.window.batch_written, count, seconds)
+
+    def dir_scanned(self, cnt_scanned):
+        self.cnt_scanned = cnt_scanned
+        wx.CallAfter(self.window.file_scanned, cnt_scanned)
+
+    def file_md5(self, path, fingerprint):
+        """return (md5, changed), reusing the cached md5 if path is unchanged"""
+        cached = self.fingerprints.get(path)
+        if cached is not None and cached[:3] == fingerprint:
+            return cached[3], False
+        return self.hash_file(path), True
+
+    def hash_file(self, path):
+        return util.md5_for_file(path)
+
+    def file_meta(self, rawname, ext, md5, fingerprint):
+        return {'rawname': [rawname],
+                'ext': ext,
+                'md5': md5,
+                'bytes': fingerprint[0],
+                }
+
+    def found(self, path, file_meta, fingerprint=None):
+        """report a target file and store it
+
+        @fingerprint: written to the hash cache if given"""
+        wx.CallAfter(self.window.file_found, path, file_meta['md5'])
+        return self.file_hdlr(path, file_meta, fingerprint) or 0
+
+
+class PipelineScan(FileScan):
+    """FileScan with walking, hashing and db writes as separate stages
+
+    walker thread -> hash workers -> scan thread, connected by bounded
+    queues. hashing runs on `settings.hash_workers` threads, each handing
+    its file to a process pool if `settings.hash_pool` is 'process'.
+    db writes and window callbacks stay on the scan thread.
+    """
+
+    def __init__(self, tar_path, window, force_rehash=False, listener=None):
+        FileScan.__init__(self, tar_path, window, force_rehash, listener)
+        self.workers = max(1, settings.hash_workers)
+        self.pool_type = settings.hash_pool
+        self.path_queue = Queue.Queue(settings.scan_queue_size)
+        self.meta_queue = Queue.Queue(settings.scan_queue_size)
+        self.pool = None
+
+    def scan_path(self, src_path):
+        if self.pool_type == 'process':
+            self.pool = multiprocessing.Pool(self.workers)
+        stages = [threading.Thread(target=self._walk, args=(src_path,))]
+        stages += [threading.Thread(target=self._hash) for i in range(self.workers)]
+        for stage in stages:
+            stage.daemon = True
+            stage.start()
+
+        # every hash worker puts a None when it is done
+        added = 0
+        running = self.workers
+        try:
+            while running:
+                item = self.meta_queue.get()
+                if item is None:
+                    running -= 1
                 else:
-                    added += self.scan_path(abs_path) or 0
-            return added
+                    added += self.found(*item)
+        finally:
+            if running:
+                # found() failed: stop the other stages, and take what they
+                # still put so none of them blocks on a full queue
+                self.stop()
+                while running:
+                    if self.meta_queue.get() is None:
+                        running -= 1
+            for stage in stages:
+                stage.join()
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+        return added
+
+    def _walk(self, src_path):
+        try:
+            for item in self.iter_path(src_path):
+                self.path_queue.put(item)
+        finally:
+            for i in range(self.workers):
+                self.path_queue.put(None)
+
+    def _hash(self):
+        try:
+            while True:
+                item = self.path_queue.get()
+                if item is None:
+                    break
+                if self.stopFlag:
+                    continue  # drain the queue without hashing
+                path, rawname, ext, fingerprint = item
+                try:
+                    md5, changed = self.file_md5(path, fingerprint)
+                except (IOError, OSError):
+                    continue  # unreadable, skip it
+                file_meta = self.file_meta(rawname, ext, md5, fingerprint)
+                self.meta_queue.put((path, file_meta, fingerprint if changed else None))
+        finally:
+            self.meta_queue.put(None)
+
+    def hash_file(self, path):
+        if self.pool is None:
+            return util.md5_for_file(path)
+        return self.pool.apply(util.md5_for_file, (path,))
+
+
+class SizeFirstScan(PipelineScan):
+    """PipelineScan that hashes possible duplicates first
+
+    new files can only duplicate each other, or a book, if their sizes
+    match, see lib.dedupe. unchanged files, whose md5 is cached, go to
+    the hash workers as they are walked; new files wait for the end of
+    the walk, then those sharing their size go first and the files of
+    unique size last. grouping reads nothing, and every file is still
+    hashed as md5 is the book id. with `settings.defer_hash`, files of
+    unique size are listed in the window before they are hashed.
+    """
+
+    def __init__(self, tar_path, window, force_rehash=False, listener=None):
+        PipelineScan.__init__(self, tar_path, window, force_rehash, listener)
+        self.defer_hash = settings.defer_hash
+        self.deferred = set()  # paths listed before they were hashed
+
+    def iter_path(self, src_path):
+        """yield target files under src_path, possible duplicates first"""
+        pending = []
+        for item in PipelineScan.iter_path(self, src_path):
+            path, rawname, ext, fingerprint = item
+            if self.fingerprints.get(path, ())[:3] == fingerprint:
+                yield item
+            else:
+                pending.append(item)
+        if self.stopFlag:
+            return
+
+        unique, colliding = dedupe.size_first(pending, lambda item: item[3][0],
+                                              get_repo().get_book_sizes())
+        self.cnt_unique = len(unique)
+        if self.defer_hash:
+            for item in unique:
+                self.deferred.add(item[0])
+                wx.CallAfter(self.window.file_found, item[0], None)
+        for item in colliding + unique:
+            if self.stopFlag:
+                return
+            yield item
+
+    def found(self, path, file_meta, fingerprint=None):
+        if path not in self.deferred:
+            return PipelineScan.found(self, path, file_meta, fingerprint)
+        wx.CallAfter(self.window.file_hashed, path, file_meta['md5'])
+        return self.file_hdlr(path, file_meta, fingerprint) or 0
+
+
+def new_scanner(tar_path, window, force_rehash=False, listener=None):
+    """scan thread for tar_path, configured by settings"""
+    if settings.size_first:
+        return SizeFirstScan(tar_path, window, force_rehash, listener)
+    if settings.hash_workers > 1:
+        return PipelineScan(tar_path, window, force_rehash, listener)
+    return FileScan(tar_path, window, force_rehash, listener)
 
 
 class ScanFrame(wx.Frame):
+    """window to scan directories for books
+
+    @listener: optional, told about the scans:
+        scan_started() and scan_stopped() on the UI thread,
+        book_found(file_meta) on scan threads for every book, once stored
+    """
 
-    def __init__(self):
+    def __init__(self, listener=None):
         wx.Frame.__init__(self, parent=None, title="Scan Books",
                           pos=(100, 100), size=(1180, 600))
         self.threads = []
+        self.listener = listener
         self.buildUI()
 
     def buildUI(self):
@@ -90,12 +280,15 @@ class ScanFrame(wx.Frame):
         self.stopBtn.Disable()
         self.scan_cnt_label = wx.StaticText(parent=self, label='Files Scanned:', style=wx.ALIGN_CENTER)
         self.scan_cnt_value = wx.StaticText(parent=self, label='0', style=wx.ALIGN_CENTER)
+        self.rehashBox = wx.CheckBox(parent=self, label='Force rehash')
+        self.rehashBox.SetValue(settings.force_rehash)
 
         self.toolbox = wx.BoxSizer(wx.VERTICAL)
         self.toolbox.Add(self.startBtn, 1, wx.ALL | wx.EXPAND, 5, 0)
         self.toolbox.Add(self.stopBtn, 1, wx.ALL | wx.EXPAND, 5, 0)
         self.toolbox.Add(self.scan_cnt_label, 1, wx.ALL | wx.EXPAND, 5, 0)
         self.toolbox.Add(self.scan_cnt_value, 1, wx.ALIGN_CENTER, 5, 0)
+        self.toolbox.Add(self.rehashBox, 1, wx.ALL | wx.EXPAND, 5, 0)
         
         self.mainbox = wx.BoxSizer(wx.HORIZONTAL)
         self.mainbox.Add(self.scan_log, 1, wx.ALL | wx.EXPAND, 5, 5)
@@ -108,17 +301,31 @@ class ScanFrame(wx.Frame):
         self.stopBtn.Bind(wx.EVT_BUTTON, self.OnStopScan)
 
     def file_found(self, filepath, md5):
-        self.scan_log.AppendText('add %s, md5: %s\n' % (filepath, md5))
+        self.scan_log.AppendText('add %s, md5: %s\n' % (filepath, md5 or 'pending'))
+
+    def file_hashed(self, filepath, md5):
+        self.scan_log.AppendText('hashed %s, md5: %s\n' % (filepath, md5))
+
+    def batch_written(self, count, seconds):
+        self.scan_log.AppendText('saved %s files in %.3fs\n' % (count, seconds))
 
     def file_scanned(self, cnt):
         self.scan_cnt_value.SetLabel(str(cnt))
 
-    def scan_stopped(self, scanned_path, cnt_found, cnt_scanned):
+    def scan_stopped(self, scanned_path, cnt_found, cnt_scanned, cnt_unique=0, error=None):
         self.startBtn.Enable()
         self.stopBtn.Disable()
-        msg = '\nscan finished! %s/%s (found/scanned) in %s\n'\
-                % (cnt_found, cnt_scanned, os.path.abspath(scanned_path))
+        if error is not None:
+            msg = '\nscan failed! %s scanned in %s: %r\n'\
+                    % (cnt_scanned, os.path.abspath(scanned_path), error)
+        else:
+            msg = '\nscan finished! %s/%s (found/scanned) in %s\n'\
+                    % (cnt_found, cnt_scanned, os.path.abspath(scanned_path))
+        if cnt_unique > 0:
+            msg += 'size-first dedupe: %s files of unique size hashed last\n' % cnt_unique
         self.scan_log.AppendText(msg)
+        if self.listener is not None:
+            self.listener.scan_stopped()
 
     def OnStartScan(self, event):
         # clear log if too big
@@ -128,8 +335,11 @@ class ScanFrame(wx.Frame):
         if dlg.ShowModal() == wx.ID_OK:
             self.startBtn.Disable()
             self.stopBtn.Enable()
-            scan_thread = FileScan(dlg.GetPath(), self)
+            scan_thread = new_scanner(dlg.GetPath(), self, self.rehashBox.GetValue(),
+                                      self.listener)
             self.threads.append(scan_thread)
+            if self.listener is not None:
+                self.listener.scan_started()
             scan_thread.start()
 
     def OnStopScan(self, event):
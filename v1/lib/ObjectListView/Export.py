@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#----------------------------------------------------------------------------
+# Name:         Export.py
+# License:      wxWindows license
+#----------------------------------------------------------------------------
+
+"""
+Exporters write rows of values -- lists of the strings shown in the columns of
+an ObjectListView -- to a sink, which is anything with a write() method that
+takes unicode text: a file opened with io.open() or codecs.open(), an
+io.StringIO, a socket wrapper.
+
+Rows are taken from an iterable and written a chunk at a time, so exporting
+many rows never holds all of them, or all of their text, in memory. Given a
+generator of rows, such as ObjectListView.YieldValues(), the values of each
+model object are only worked out as it is written.
+
+Example::
+    with io.open("books.csv", "w", encoding="utf-8") as sink:
+        self.olv.ExportObjects(self.olv.YieldSelectedObjects(), sink, "csv", withTitles=True)
+
+This module provides exporters for tab separated values, CSV, JSON Lines and
+HTML tables, listed by name in FORMATS.
+"""
+
+import cgi
+import collections
+import cStringIO
+import csv
+import json
+
+"""How many rows are formatted before being written to the sink in one go"""
+CHUNK_ROWS = 1000
+
+
+def WriteTabSeparated(rows, sink, titles=None, chunkRows=CHUNK_ROWS):
+    """
+    Write the given rows as tab separated values, one row per line.
+
+    Tabs and line breaks within values are replaced by spaces.
+    """
+    def _format(row):
+        return u"\t".join(_OneLine(x) for x in row) + u"\n"
+
+    if titles:
+        sink.write(_format(titles))
+    _WriteChunks((_format(x) for x in rows), sink, chunkRows)
+
+
+def WriteCsv(rows, sink, titles=None, chunkRows=CHUNK_ROWS):
+    """
+    Write the given rows as comma separated values
+    """
+    # The csv module only writes byte strings, so each chunk is written as UTF-8 to a
+    # buffer and decoded again. Lines end like those of the other exporters.
+    buffer = cStringIO.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+
+    def _flush():
+        sink.write(buffer.getvalue().decode("utf-8"))
+        buffer.seek(0)
+        buffer.truncate()
+
+    if titles:
+        writer.writerow([_Encode(x) for x in titles])
+    for (i, row) in enumerate(rows):
+        writer.writerow([_Encode(x) for x in row])
+        if (i + 1) % chunkRows == 0:
+            _flush()
+    _flush()
+
+
+def WriteJsonLines(rows, sink, titles=None, chunkRows=CHUNK_ROWS):
+    """
+    Write each of the given rows as a line of JSON: an object keyed by the given column
+    titles, or an array if there are no titles
+    """
+    if titles:
+        def _format(row):
+            return _Dumps(collections.OrderedDict(zip(titles, row))) + u"\n"
+    else:
+        def _format(row):
+            return _Dumps(row) + u"\n"
+
+    _WriteChunks((_format(x) for x in rows), sink, chunkRows)
+
+
+def WriteHtml(rows, sink, titles=None, chunkRows=CHUNK_ROWS):
+    """
+    Write the given rows as an HTML table
+    """
+    def _format(row, tag=u"td"):
+        cells = [u"<%s>%s</%s>" % (tag, cgi.escape(_Unicode(x)), tag) for x in row]
+        return u"<tr>" + u"".join(cells) + u"</tr>"
+
+    sink.write(u"<table>")
+    if titles:
+        sink.write(_format(titles, u"th"))
+    _WriteChunks((_format(x) for x in rows), sink, chunkRows)
+    sink.write(u"</table>")
+
+
+"""Exporters by the name of their format"""
+FORMATS = {
+    "tsv": WriteTabSeparated,
+    "csv": WriteCsv,
+    "jsonl": WriteJsonLines,
+    "html": WriteHtml,
+}
+
+
+def Write(format, rows, sink, titles=None, chunkRows=CHUNK_ROWS):
+    """
+    Write the given rows to the sink in the named format (one of the keys of FORMATS)
+    """
+    try:
+        writer = FORMATS[format]
+    except KeyError:
+        raise ValueError("unknown export format: %r" % (format,))
+    writer(rows, sink, titles, chunkRows)
+
+#----------------------------------------------------------------------------
+# Helpers
+
+def _WriteChunks(texts, sink, chunkRows):
+    """
+    Write the given texts to the sink, joining chunkRows of them at a time
+    """
+    chunk = list()
+    for x in texts:
+        chunk.append(x)
+        if len(chunk) >= chunkRows:
+            sink.write(u"".join(chunk))
+            chunk = list()
+    if chunk:
+        sink.write(u"".join(chunk))
+
+
+def _Unicode(value):
+    if isinstance(value, unicode):
+        return value
+    if isinstance(value, str):
+        return value.decode("utf-8", "replace")
+    return unicode(value)
+
+
+def _Encode(value):
+    return _Unicode(value).encode("utf-8")
+
+
+def _OneLine(value):
+    return _Unicode(value).replace(u"\t", u" ").replace(u"\r", u" ").replace(u"\n", u" ")
+
+
+def _Dumps(value):
+    # With ensure_ascii off, dumps() returns a byte string when every value is one
+    return _Unicode(json.dumps(value, ensure_ascii=False))
@@ -22,6 +22,10 @@ Filters are simple callable objects which accept a single parameter, which
 is the list of model objects to be filtered, and returns a collection of
 those objects which will be presented to the user.
 
+A filter that decides on each model object by itself, without regard to the
+others, can say so with a true 'perObject' attribute. A FastObjectListView can
+then filter just the objects being added to it, rather than all its objects.
+
 This module provides some standard filters.
 
 Filters almost always impose a performance penalty on the ObjectListView.
@@ -37,7 +41,10 @@ def Predicate(predicate):
     Example::
         self.olv.SetFilter(Filter.Predicate(lambda x: x.IsOverdue()))
     """
-    return lambda modelObjects: [x for x in modelObjects if predicate(x)]
+    def _filter(modelObjects):
+        return [x for x in modelObjects if predicate(x)]
+    _filter.perObject = True
+    return _filter
 
 
 def Head(num):
@@ -69,8 +76,20 @@ class TextSearch(object):
     Example::
         self.olv.SetFilter(Filter.TextSearch(self.olv, text="findthis"))
         self.olv.RepopulateList()
+
+    The filter remembers what it last matched. When the text grows (the user
+    typing "mach", "machi", "machin"), every match must be one of the previous
+    matches, so only those are searched again. Anything else -- shorter or
+    different text, other columns, or a list that has changed -- searches all
+    the model objects again. Call Reset() if the values of the model objects
+    change without the list changing.
+
+    Values are compared through the search keys their columns cache (see
+    ColumnDefn.GetSearchKey()), so they are only converted and lowercased once.
     """
 
+    perObject = True
+
     def __init__(self, objectListView, columns=(), text=""):
         """
         Create a filter that includes on modelObject that have 'self.text' somewhere in the given columns.
@@ -78,6 +97,7 @@ class TextSearch(object):
         self.objectListView = objectListView
         self.columns = columns
         self.text = text
+        self.Reset()
 
     def __call__(self, modelObjects):
         """
@@ -93,14 +113,53 @@ class TextSearch(object):
             cols = [self.objectListView.columns[0]]
 
         textToFind = self.text.lower()
+        colsAndText = [(col, col.NormaliseSearchText(self.text)) for col in cols]
 
         def _containsText(modelObject):
-            for col in cols:
-                if textToFind in col.GetStringValue(modelObject).lower():
+            for (col, text) in colsAndText:
+                if text in col.GetSearchKey(modelObject):
                     return True
             return False
 
-        return [x for x in modelObjects if _containsText(x)]
+        if self._CanRefine(modelObjects, cols, textToFind):
+            candidates = self.lastMatches
+        else:
+            candidates = enumerate(modelObjects)
+        self.lastMatches = [(i, x) for (i, x) in candidates if _containsText(x)]
+        self.lastText = textToFind
+        self.lastColumns = list(cols)
+        self.lastSource = modelObjects
+        self.lastSourceLength = len(modelObjects)
+
+        return [x for (i, x) in self.lastMatches]
+
+    def _CanRefine(self, modelObjects, cols, textToFind):
+        """
+        Can the objects matching textToFind be found among our last matches?
+        """
+        if not self.lastText or self.lastText not in textToFind:
+            return False
+        if modelObjects is not self.lastSource or len(modelObjects) != self.lastSourceLength:
+            return False
+        if list(cols) != self.lastColumns:
+            return False
+
+        # The list may have been sorted, or had objects removed and added, in place.
+        # Our matches remember where they were, so check they are still there.
+        for (i, x) in self.lastMatches:
+            if modelObjects[i] is not x:
+                return False
+        return True
+
+    def Reset(self):
+        """
+        Forget the last matches, so the next filtering searches all the model objects
+        """
+        self.lastText = None
+        self.lastMatches = []
+        self.lastColumns = None
+        self.lastSource = None
+        self.lastSourceLength = 0
 
     def SetText(self, text):
         """
@@ -127,6 +186,7 @@ class Chain(object):
         The order of the filters is important.
         """
         self.filters = filters
+        self.perObject = all(getattr(x, "perObject", False) for x in filters)
 
 
     def __call__(self, modelObjects):
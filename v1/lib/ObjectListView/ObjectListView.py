@@ -1,15 +1,28 @@
 # -*- coding: utf-8 -*-
 import wx
+import bisect
+import collections
 import datetime
+import heapq
+import io
 import itertools
 import locale
 import operator
 import string
 import time
+import unicodedata
 
 import CellEditor
+import Export
 import OLVEvent
 
+# Clock for timing batched updates: monotonic where there is one (Python 3), else wall
+# time. time.clock() is no good for this, since on Linux it measures processor time.
+try:
+    _monotonic = time.monotonic
+except AttributeError:
+    _monotonic = time.time
+
 
 class ObjectListView(wx.ListCtrl):
     CELLEDIT_NONE = 0
@@ -32,8 +45,9 @@ class ObjectListView(wx.ListCtrl):
     will be interpretted as a new search and any previous search text will be cleared"""
     SEARCH_KEYSTROKE_DELAY = 0.75
 
-    """When typing into a list and searching on an unsorted column, we don't even try to search
-    if there are more than this many rows."""
+    """When typing into a list and searching on an unsorted column without a search index
+    (see ColumnDefn.useSearchIndex), we don't even try to search if there are more than
+    this many rows."""
     MAX_ROWS_FOR_UNSORTED_SEARCH = 100000
 
     def __init__(self, *args, **kwargs):
@@ -69,6 +83,7 @@ class ObjectListView(wx.ListCtrl):
         self.innerList = []
         self.columns = []
         self.sortColumnIndex = -1
+        self.secondarySortColumnIndex = -1
         self.sortAscending = True
         self.smallImageList = None
         self.normalImageList = None
@@ -81,6 +96,10 @@ class ObjectListView(wx.ListCtrl):
         self.whenLastTypingEvent = 0
         self.filter = None
         self.objectToIndexMap = None
+        self.objectToIndexMapStaleFrom = None # rows from here on may be wrong in objectToIndexMap
+        self.modelObjectsSortedBy = None # (sort column, secondary sort column, ascending)
+        self.searchIndexes = dict() # column -> _SearchKeyIndex, see _GetSearchIndex()
+        self.columnSizer = _ColumnSizer() # see AutoSizeColumns()
 
         self.rowFormatter = kwargs.pop("rowFormatter", None)
         self.useAlternateBackColors = kwargs.pop("useAlternateBackColors", True)
@@ -142,6 +161,7 @@ class ObjectListView(wx.ListCtrl):
         column will be installed as the CheckStateColumn for this listview.
         """
         sortCol = self.GetSortColumn()
+        secondarySortCol = self.GetSecondarySortColumn()
         wx.ListCtrl.ClearAll(self)
         self.checkStateColumn = None
         self.columns = []
@@ -152,6 +172,7 @@ class ObjectListView(wx.ListCtrl):
                 self.AddColumnDefn(ColumnDefn(*x))
         # Try to preserve the column column
         self.SetSortColumn(sortCol)
+        self.SetSecondarySortColumn(secondarySortCol)
         if repopulate:
             self.RepopulateList()
 
@@ -341,6 +362,7 @@ class ObjectListView(wx.ListCtrl):
         if len(self.innerList) == 0:
             return self.SetObjects(modelObjects)
 
+        self._AddToIndexes(modelObjects)
         try:
             self.Freeze()
             originalSize = len(self.innerList)
@@ -384,16 +406,23 @@ class ObjectListView(wx.ListCtrl):
     def AutoSizeColumns(self):
         """
         Resize our auto sizing columns to match the data
+
+        Asking the control to autosize a column measures every row. Instead, the width is
+        worked out from the visible rows and the rows with the longest strings in the
+        column (see _ColumnSizer), and a column is only resized when its width differs.
         """
+        sizer = self.columnSizer
         for (iCol, col) in enumerate(self.columns):
             if col.width == wx.LIST_AUTOSIZE:
-                self.SetColumnWidth(iCol, wx.LIST_AUTOSIZE)
+                width = sizer.CalcWidth(self, iCol, col)
+                if width == -1:
+                    continue
 
                 # The new width must be within our minimum and maximum
-                colWidth = self.GetColumnWidth(iCol)
-                boundedWidth = col.CalcBoundedWidth(colWidth)
-                if colWidth != boundedWidth:
-                    self.SetColumnWidth(iCol, boundedWidth)
+                width = col.CalcBoundedWidth(width)
+                # Compare with the control, since the user may have resized the column
+                if self.GetColumnWidth(iCol) != width:
+                    self.SetColumnWidth(iCol, width)
 
         self._ResizeSpaceFillingColumns()
 
@@ -418,23 +447,33 @@ class ObjectListView(wx.ListCtrl):
 
         This will be one line per object and tab-separated values per line.
         Under windows there will be a HTML table version put on the clipboard as well.
+
+        The objects may be any iterable, like YieldSelectedObjects(). The text is written
+        straight from their values, without building a list of them first.
         """
-        if objects is None or len(objects) == 0:
+        if objects is None:
             return
 
-        # Get all the values of the given rows into multi-list
-        rows = self._GetValuesAsMultiList(objects)
-
-        # Make a text version of the values
-        lines = [ "\t".join(x) for x in rows ]
-        txt = "\n".join(lines) + "\n"
-
-        # Make a html version on Windows
+        # Only Windows takes the html version, which needs a second pass over the objects
         try:
-            lines = [ "<td>" + "</td><td>".join(x) + "</td>" for x in rows ]
-            html = "<table><tr>" + "</tr><tr>".join(lines) + "</tr></table>"
-            self._PutTextAndHtmlToClipboard(txt, html)
+            import win32clipboard
+            withHtml = True
         except ImportError:
+            withHtml = False
+        if withHtml and iter(objects) is objects:
+            objects = list(objects)
+
+        sink = io.StringIO()
+        self.ExportObjects(objects, sink, "tsv")
+        txt = sink.getvalue()
+        if not txt:
+            return
+
+        if withHtml:
+            sink = io.StringIO()
+            self.ExportObjects(objects, sink, "html")
+            self._PutTextAndHtmlToClipboard(txt, sink.getvalue())
+        else:
             cb = wx.Clipboard()
             if cb.Open():
                 cb.SetData(wx.TextDataObject(txt))
@@ -445,10 +484,17 @@ class ObjectListView(wx.ListCtrl):
         """
         Return a list of lists of the string of the aspects of the given objects
         """
+        return list(self.YieldValues(objects))
+
+
+    def _GetExportColumns(self):
+        """
+        Return the columns whose values are copied or exported
+        """
         cols = self.columns[:]
         if self.checkStateColumn is not None:
             cols.remove(self.checkStateColumn)
-        return [[column.GetStringValue(x) for column in cols] for x in objects]
+        return cols
 
 
     def _PutTextAndHtmlToClipboard(self, txt, fragment):
@@ -505,7 +551,7 @@ class ObjectListView(wx.ListCtrl):
         """
         Copy the selected objects to the clipboard
         """
-        self.CopyObjectsToClipboard(self.GetSelectedObjects())
+        self.CopyObjectsToClipboard(self.YieldSelectedObjects())
 
 
     def DeleteAllItems(self):
@@ -541,6 +587,22 @@ class ObjectListView(wx.ListCtrl):
         return self.GetSubItemRect(rowIndex, subItemIndex, wx.LIST_RECT_LABEL)
 
 
+
+    def ExportObjects(self, objects, sink, format="tsv", withTitles=False):
+        """
+        Write the values of the given objects to the given sink, in one of the formats of
+        Export.FORMATS: "tsv", "csv", "jsonl" or "html".
+
+        The objects may be any iterable, like YieldSelectedObjects(). Their values are
+        worked out and written a chunk at a time (see the Export module), so they are
+        never all held in memory at once. For virtual lists, the objects are only fetched
+        as they are written.
+        """
+        titles = None
+        if withTitles:
+            titles = [x.title for x in self._GetExportColumns()]
+        Export.Write(format, self.YieldValues(objects), sink, titles)
+
     def _FormatAllRows(self):
         """
         Set up the required formatting on all rows
@@ -624,6 +686,7 @@ class ObjectListView(wx.ListCtrl):
         """
         Refresh the display of the given model
         """
+        self._ForgetKeys([modelObject])
         idx = self.GetIndexOf(modelObject)
         if idx != -1:
             self.RefreshIndex(self._MapModelIndexToListIndex(idx), modelObject)
@@ -641,6 +704,41 @@ class ObjectListView(wx.ListCtrl):
             self.Thaw()
 
 
+    def _ForgetKeys(self, modelObjects=None):
+        """
+        Forget the search and sort keys the columns hold for the given model objects, or
+        for all model objects if modelObjects is None
+        """
+        for col in self.columns:
+            col.ForgetKeys(modelObjects)
+        if modelObjects is None:
+            self.searchIndexes = dict()
+            self.columnSizer.Clear()
+        else:
+            for index in self.searchIndexes.itervalues():
+                index.Forget(modelObjects)
+            self.columnSizer.Forget(modelObjects)
+
+
+    def _AddToIndexes(self, modelObjects):
+        """
+        Tell our search indexes and column sizer about the given new model objects
+        """
+        for index in self.searchIndexes.itervalues():
+            index.Add(modelObjects)
+        self.columnSizer.Add(modelObjects)
+
+
+    def _RemoveFromIndexes(self, modelObjects):
+        """
+        Take the given model objects, which we no longer hold, out of our search indexes
+        and column sizer
+        """
+        for index in self.searchIndexes.itervalues():
+            index.Remove(modelObjects)
+        self.columnSizer.Remove(modelObjects)
+
+
     def RemoveObject(self, modelObject):
         """
         Remove the given object from our collection of objects.
@@ -651,27 +749,92 @@ class ObjectListView(wx.ListCtrl):
     def RemoveObjects(self, modelObjects):
         """
         Remove the given collections of objects from our collection of objects.
+
+        The rows of the objects are deleted and the other rows are left where they are,
+        so this doesn't rebuild the list.
         """
-        # Unlike AddObjects(), there is no clever way to do this -- we have to simply
-        # remove the objects and rebuild the whole list. We can't just remove the rows
-        # because every wxListItem holds the index of its matching model object. If we
-        # remove the first model object, the index of every object will change.
-        selection = self.GetSelectedObjects()
+        self._ForgetKeys(modelObjects)
+        self._RemoveFromIndexes(modelObjects)
+        indices = self._RemoveFromInnerList(modelObjects)
+        if self.innerList is not self.modelObjects:
+            self._RemoveFromList(self.modelObjects, modelObjects)
+        if not indices:
+            return
+
+        # Every item holds the index of its model object in innerList as its data, but the
+        # items may have been sorted in another order than innerList. In one pass over the
+        # items, find those of the removed objects and shift down the data of the others.
+        # Then delete them from the bottom up, so the rows still to go stay where they are.
+        removed = set(indices)
+        first = indices[0]
+        try:
+            self.Freeze()
+            rows = list()
+            for row in xrange(self.GetItemCount()):
+                data = self.GetItemData(row)
+                if data in removed:
+                    rows.append(row)
+                elif data > first:
+                    self.SetItemData(row, data - bisect.bisect_left(indices, data))
+            for row in reversed(rows):
+                self.DeleteItem(row)
+
+            # The rows below the first deleted one have moved up, and so changed colour
+            if rows and self.useAlternateBackColors and self.InReportView():
+                for row in xrange(rows[0], self.GetItemCount()):
+                    item = self.GetItem(row)
+                    self._FormatOneItem(item, row, self.GetObjectAt(row))
+                    self.SetItem(item)
+        finally:
+            self.Thaw()
+
+        if len(self.innerList) == 0:
+            self.stEmptyListMsg.Show()
+
+
+    def _RemoveFromInnerList(self, modelObjects):
+        """
+        Remove the given objects from innerList, keeping the order of the rest and
+        patching our object map.
+
+        Return the indices in innerList of the objects that were removed, in increasing order.
+        """
+        indices = set()
+        for x in modelObjects:
+            i = self.GetIndexOf(x)
+            if i != -1:
+                indices.add(i)
+        indices = sorted(indices)
+        for i in reversed(indices):
+            del self.innerList[i]
+
+        if indices and self.objectToIndexMap is not None:
+            for x in modelObjects:
+                try:
+                    self.objectToIndexMap.pop(x, None)
+                except TypeError:
+                    pass
+            if self.objectToIndexMapStaleFrom is None:
+                self.objectToIndexMapStaleFrom = indices[0]
+            else:
+                self.objectToIndexMapStaleFrom = min(indices[0], self.objectToIndexMapStaleFrom)
+        return indices
 
-        # Use sets to quickly remove objects from self.modelObjects
-        # For large collections, this is MUCH faster.
+
+    def _RemoveFromList(self, aList, modelObjects):
+        """
+        Remove the given objects from aList, keeping the order of the rest
+        """
+        # Use a set to quickly find the objects. For large collections, this is MUCH faster.
         try:
-            s1 = set(self.modelObjects)
-            s2 = set(modelObjects)
-            self.modelObjects = list(s1 - s2)
+            toRemove = set(modelObjects)
+            aList[:] = [x for x in aList if x not in toRemove]
         except TypeError:
             # Not every object can be hashed, so some model objects cannot be placed in sets.
             # For such objects, we have to resort to the slow method.
             for x in modelObjects:
-                self.modelObjects.remove(x)
-
-        self.RepopulateList()
-        self.SelectObjects(selection)
+                if x in aList:
+                    aList.remove(x)
 
 
     def _ResizeSpaceFillingColumns(self):
@@ -769,6 +932,7 @@ class ObjectListView(wx.ListCtrl):
             self.modelObjects = list()
         else:
             self.modelObjects = modelObjects[:]
+        self._ForgetKeys()
 
         self.RepopulateList()
 
@@ -864,15 +1028,19 @@ class ObjectListView(wx.ListCtrl):
         This method works on the visible item in the control. If a filter
         is in place, not all model object given to SetObjects() are visible.
         """
-        # Rebuild our index map if it has been invalidated. The TypeError
-        # exceptions are for objects that cannot be hashed (like lists)
+        # Rebuild our index map if it has been invalidated, or just the rows that have
+        # moved since it was built. The TypeError exceptions are for objects that cannot
+        # be hashed (like lists)
         if self.objectToIndexMap is None:
             self.objectToIndexMap = dict()
-            for (i, x) in enumerate(self.innerList):
+            self.objectToIndexMapStaleFrom = 0
+        if self.objectToIndexMapStaleFrom is not None:
+            for i in xrange(self.objectToIndexMapStaleFrom, len(self.innerList)):
                 try:
-                    self.objectToIndexMap[x] = i
+                    self.objectToIndexMap[self.innerList[i]] = i
                 except TypeError:
                     pass
+            self.objectToIndexMapStaleFrom = None
 
         # Use our map to find the object (but fall back to simple search
         # for non-hashable objects)
@@ -993,6 +1161,16 @@ class ObjectListView(wx.ListCtrl):
             return self.columns[self.sortColumnIndex]
 
 
+    def GetSecondarySortColumn(self):
+        """
+        Return the column that orders rows which are equal in the sort column
+        """
+        if self.secondarySortColumnIndex < 0 or self.secondarySortColumnIndex >= len(self.columns):
+            return None
+        else:
+            return self.columns[self.secondarySortColumnIndex]
+
+
     def GetStringValueAt(self, modelObject, columnIndex):
         """
         Return a string representation of the value that should be display at the given column of the given modelObject
@@ -1068,6 +1246,24 @@ class ObjectListView(wx.ListCtrl):
             self._UpdateColumnSortIndicators()
 
 
+    def SetSecondarySortColumn(self, column):
+        """
+        Set the column that orders rows which are equal in the sort column.
+
+        'column' can be None (no secondary ordering), a ColumnDefn, or the index of the
+        column desired. It is used from the next sort on.
+        """
+        if column is None:
+            self.secondarySortColumnIndex = -1
+        elif isinstance(column, ColumnDefn):
+            try:
+                self.secondarySortColumnIndex = self.columns.index(column)
+            except ValueError:
+                self.secondarySortColumnIndex = -1
+        else:
+            self.secondarySortColumnIndex = column
+
+
     def YieldSelectedObjects(self):
         """
         Progressively yield the selected modelObjects
@@ -1078,6 +1274,15 @@ class ObjectListView(wx.ListCtrl):
             i = self.GetNextItem(i, wx.LIST_NEXT_ALL, wx.LIST_STATE_SELECTED)
 
 
+    def YieldValues(self, objects):
+        """
+        Progressively yield a list of the strings of the aspects of each of the given objects
+        """
+        cols = self._GetExportColumns()
+        for x in objects:
+            yield [column.GetStringValue(x) for column in cols]
+
+
     #----------------------------------------------------------------------------
     # Calculating
 
@@ -1261,12 +1466,16 @@ class ObjectListView(wx.ListCtrl):
         if len(prefix) == 1:
             start = (start + 1) % self.GetItemCount()
 
-        # If we are searching on a sorted column, use a binary search
+        # If we are searching on a sorted column, use a binary search. Otherwise, the
+        # column may have an index of its search keys that we can search in the same way
         if self._CanUseBisect(searchColumn):
             if self._FindByBisect(searchColumn, prefix, start, self.GetItemCount()):
                 return
             if self._FindByBisect(searchColumn, prefix, 0, start):
                 return
+        elif self._GetSearchIndex(searchColumn) is not None:
+            if self._FindBySearchIndex(searchColumn, prefix, start):
+                return
         else:
             # A binary search on a sorted column can handle any number of rows. A linear
             # search cannot. So we impose an arbitrary limit on the number of rows to
@@ -1279,12 +1488,12 @@ class ObjectListView(wx.ListCtrl):
             # the rows in two partitions: start to the end of the collection, and then
             # from the beginning to the start position. Expressing this in other languages
             # is a pain, but it's elegant in Python. I just love Python :)
+            prefix = searchColumn.NormaliseSearchText(prefix)
             for i in itertools.chain(range(start, self.GetItemCount()), range(0, start)):
                 #self.__rows += 1
                 model = self.GetObjectAt(i)
                 if model is not None:
-                    strValue = searchColumn.GetStringValue(model)
-                    if strValue.lower().startswith(prefix):
+                    if searchColumn.GetSearchKey(model).startswith(prefix):
                         self._SelectAndFocus(i)
                         return
         wx.Bell()
@@ -1317,6 +1526,7 @@ class ObjectListView(wx.ListCtrl):
         # If the sort is descending, we have to use greater-equal, and suffix the
         # search string to make sure we find the first match (without the suffix
         # we always find the last match)
+        prefix = searchColumn.NormaliseSearchText(prefix)
         if self.sortAscending:
             cmpFunc = operator.lt
             searchFor = prefix
@@ -1329,8 +1539,7 @@ class ObjectListView(wx.ListCtrl):
         hi = end
         while lo < hi:
             mid = (lo + hi) // 2
-            strValue = searchColumn.GetStringValue(self.GetObjectAt(mid))
-            if cmpFunc(searchFor, strValue.lower()):
+            if cmpFunc(searchFor, searchColumn.GetSearchKey(self.GetObjectAt(mid))):
                 hi = mid
             else:
                 lo = mid+1
@@ -1338,13 +1547,70 @@ class ObjectListView(wx.ListCtrl):
         if lo < start or lo >= end:
             return False
 
-        strValue = searchColumn.GetStringValue(self.GetObjectAt(lo))
-        if strValue.lower().startswith(prefix):
+        if searchColumn.GetSearchKey(self.GetObjectAt(lo)).startswith(prefix):
             self._SelectAndFocus(lo)
             return True
 
         return False
 
+    def _GetSearchIndex(self, searchColumn):
+        """
+        Return the index of the search keys of the given column, or None if typing can't
+        search the column through an index.
+
+        The rows of an ObjectListView aren't in the order of its model objects, so finding
+        the row of an object would cost as much as the linear search. FastObjectListView
+        builds an index for columns with useSearchIndex set.
+        """
+        return None
+
+    def _FindBySearchIndex(self, searchColumn, prefix, start):
+        """
+        Use the search index of the given column to select the first row from start on
+        (wrapping around) that matches the given prefix.
+
+        If a match was found, select/focus/reveal that row and return True.
+
+        When many objects match, the rows from start on soon reach one of them, so this
+        first looks at as many rows as there are matches. Only if none of those matches
+        does it go through the matches. Either way, it looks at no more than twice as
+        many objects as match.
+        """
+        index = self._GetSearchIndex(searchColumn)
+        prefix = searchColumn.NormaliseSearchText(prefix)
+        matches = index.Count(prefix)
+        if not matches:
+            return False
+
+        count = self.GetItemCount()
+        rows = itertools.chain(xrange(start, count), xrange(0, start))
+        for i in itertools.islice(rows, matches):
+            model = self.GetObjectAt(i)
+            if model is not None and searchColumn.GetSearchKey(model).startswith(prefix):
+                self._SelectAndFocus(i)
+                return True
+
+        first = after = None
+        for model in index.Find(prefix):
+            # Objects that are filtered out or in collapsed groups don't have a row
+            i = self.GetIndexOf(model)
+            if i == -1:
+                continue
+            if i >= start:
+                if after is None or i < after:
+                    after = i
+                    if i == start:
+                        break
+            elif first is None or i < first:
+                first = i
+
+        if after is not None:
+            first = after
+        if first is None:
+            return False
+        self._SelectAndFocus(self._MapModelIndexToListIndex(first))
+        return True
+
     def _SelectAndFocus(self, rowIndex):
         """
         Select and focus on the given row.
@@ -1597,23 +1863,7 @@ class ObjectListView(wx.ListCtrl):
         if not sortColumn:
             return
 
-        secondarySortColumn = None # self.GetSecondarySortColumn()
-
-        def _singleObjectComparer(col, object1, object2):
-            value1 = col.GetValue(object1)
-            value2 = col.GetValue(object2)
-            try:
-                return locale.strcoll(value1.lower(), value2.lower())
-            except:
-                return cmp(value1, value2)
-
-        def _objectComparer(object1, object2):
-            result = _singleObjectComparer(sortColumn, object1, object2)
-            if secondarySortColumn and result == 0:
-                result = _singleObjectComparer(secondarySortColumn, object1, object2)
-            return result
-
-        self.SortListItemsBy(_objectComparer)
+        self.SortListItemsByKey(self._GetSortKeyFunc(sortColumn, self.GetSecondarySortColumn()))
 
 
     def SortListItemsBy(self, cmpFunc, ascending=None):
@@ -1638,52 +1888,75 @@ class ObjectListView(wx.ListCtrl):
         self.SortItems(_sorter)
 
 
+    def SortListItemsByKey(self, keyFunc, ascending=None):
+        """
+        Sort the existing list items by the keys that the given function returns
+        for their model objects.
+
+        This calls keyFunc once per model object, where SortListItemsBy() calls its
+        comparison function for every comparison the sort makes.
+        """
+        if ascending is None:
+            ascending = self.sortAscending
+
+        # Work out where each item should go, then let the control sort by those positions
+        order = sorted(range(len(self.innerList)), key=lambda i: keyFunc(self.innerList[i]),
+                       reverse=(not ascending))
+        positions = [0] * len(order)
+        for (position, i) in enumerate(order):
+            positions[i] = position
+
+        self.SortItems(lambda key1, key2: positions[key1] - positions[key2])
+
+
+    def _GetSortKeyFunc(self, sortColumn, secondarySortColumn=None):
+        """
+        Return a function that gives the key by which a model object sorts on the given columns
+        """
+        if secondarySortColumn is None or secondarySortColumn == sortColumn:
+            return sortColumn.GetSortKey
+        return lambda x: (sortColumn.GetSortKey(x), secondarySortColumn.GetSortKey(x))
+
+
     def _SortObjects(self, modelObjects=None, sortColumn=None, secondarySortColumn=None):
         """
-        Sort the given modelObjects in place.
+        Sort the given modelObjects in place. Return True if they were sorted by the
+        given columns, False if there was nothing to sort by or a SORT event handler
+        took over.
 
         This does not change the information shown in the control itself.
         """
         if modelObjects is None:
             modelObjects = self.modelObjects
+        if modelObjects is self.modelObjects:
+            self.modelObjectsSortedBy = None
         if sortColumn is None:
             sortColumn = self.GetSortColumn()
+        if secondarySortColumn is None:
+            secondarySortColumn = self.GetSecondarySortColumn()
         if secondarySortColumn == sortColumn:
             secondarySortColumn = None
 
         # If we don't have a sort column, we can't sort -- duhh
         if sortColumn is None:
-            return
+            return False
 
         # Let the world have a chance to sort the model objects
         evt = OLVEvent.SortEvent(self, self.sortColumnIndex, self.sortAscending, True)
         self.GetEventHandler().ProcessEvent(evt)
         if evt.IsVetoed() or evt.wasHandled:
-            return
-
-        # When sorting large groups, this is called a lot. Make it efficent.
-        # It is more efficient (by about 30%) to try to call lower() and catch the
-        # exception than it is to test for the class
-        def _getSortValue(x):
-            primary = sortColumn.GetValue(x)
-            try:
-                primary = primary.lower()
-            except AttributeError:
-                pass
-            if secondarySortColumn:
-                secondary = secondarySortColumn.GetValue(x)
-                try:
-                    secondary = secondary.lower()
-                except AttributeError:
-                    pass
-                return (primary, secondary)
-            else:
-                return primary
+            return False
 
-        modelObjects.sort(key=_getSortValue, reverse=(not self.sortAscending))
+        # When sorting large groups, this is called a lot. The columns cache the sort
+        # keys of the model objects, so they are only worked out once.
+        modelObjects.sort(key=self._GetSortKeyFunc(sortColumn, secondarySortColumn),
+                          reverse=(not self.sortAscending))
+        if modelObjects is self.modelObjects:
+            self.modelObjectsSortedBy = (sortColumn, secondarySortColumn, self.sortAscending)
 
         # Sorting invalidates our object map
         self.objectToIndexMap = None
+        return True
 
 
     def _UpdateColumnSortIndicators(self, sortColumnIndex=None, oldSortColumnIndex=-1):
@@ -1952,6 +2225,7 @@ class ObjectListView(wx.ListCtrl):
         self.GetEventHandler().ProcessEvent(evt)
         if not evt.IsVetoed() and evt.cellValue is not None:
             self.columns[subItemIndex].SetValue(rowModel, evt.cellValue)
+            self._ForgetKeys([rowModel])
             self.RefreshIndex(rowIndex, rowModel)
 
         evt = OLVEvent.CellEditFinishedEvent(self, rowIndex, subItemIndex, rowModel, False)
@@ -2012,14 +2286,21 @@ class AbstractVirtualObjectListView(ObjectListView):
     """
 
     def __init__(self, *args, **kwargs):
-        self.lastGetObjectIndex = -1
-        self.lastGetObject = None
-        self.objectGetter = None
+        # Model objects of the rows from cacheFrom on, so the object getter is called once
+        # per row rather than once per cell. The control tells us which rows it is about
+        # to draw, and we fetch those plus cacheMargin rows either side.
+        self.cachedObjects = list()
+        self.cacheFrom = 0
+        self.cacheSize = 100 # most rows kept, grows to fit what the control shows
+        self.cacheMargin = 20
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.cachePrefetched = 0
         self.listItemAttr = None
-        #self.cacheHit = 0
-        #self.cacheMiss = 0
 
-        self.SetObjectGetter(kwargs.pop("getter", None))
+        # SetObjectGetter() also forgets keys, which needs the columns that
+        # ObjectListView.__init__() has yet to make
+        self.objectGetter = kwargs.pop("getter", None)
 
         # We have to set the item count after the list has been created
         if "count" in kwargs:
@@ -2030,6 +2311,8 @@ class AbstractVirtualObjectListView(ObjectListView):
 
         ObjectListView.__init__(self, *args, **kwargs)
 
+        self.Bind(wx.EVT_LIST_CACHE_HINT, self._HandleCacheHint)
+
 
     #----------------------------------------------------------------------------
     # Commands
@@ -2039,7 +2322,7 @@ class AbstractVirtualObjectListView(ObjectListView):
         Remove all items and columns
         """
         ObjectListView.ClearAll(self)
-        self.lastGetObjectIndex = -1
+        self._ForgetCachedObjects()
         # Should this call SetItemCount()?
 
 
@@ -2048,7 +2331,7 @@ class AbstractVirtualObjectListView(ObjectListView):
         Remove all items
         """
         ObjectListView.DeleteAllItems(self)
-        self.lastGetObjectIndex = -1
+        self._ForgetCachedObjects()
         # Should this call SetItemCount()?
 
 
@@ -2056,7 +2339,7 @@ class AbstractVirtualObjectListView(ObjectListView):
         """
         Refresh the item at the given index with data associated with the given modelObject
         """
-        self.lastGetObjectIndex = -1
+        self._ForgetCachedObjects()
         self.RefreshItem(index)
 
 
@@ -2073,7 +2356,8 @@ class AbstractVirtualObjectListView(ObjectListView):
         Refresh all the objects in the given list
         """
         # We can only refresh everything
-        self.lastGetObjectIndex = -1
+        self._ForgetKeys(aList)
+        self._ForgetCachedObjects()
         self.RefreshItems(0, max(0, self.GetItemCount()-1))
         #self.Refresh()
 
@@ -2092,7 +2376,7 @@ class AbstractVirtualObjectListView(ObjectListView):
         """
         wx.ListCtrl.SetItemCount(self, count)
         self.stEmptyListMsg.Show(count == 0)
-        self.lastGetObjectIndex = -1
+        self._ForgetCachedObjects()
 
 
     def SetObjectGetter(self, aCallable):
@@ -2101,6 +2385,7 @@ class AbstractVirtualObjectListView(ObjectListView):
         this list
         """
         self.objectGetter = aCallable
+        self._ForgetKeys()
 
 
     def _FormatAllRows(self):
@@ -2165,18 +2450,75 @@ class AbstractVirtualObjectListView(ObjectListView):
         if self.objectGetter is None:
             return None
 
-        #if index == self.lastGetObjectIndex:
-        #    self.cacheHit += 1
-        #else:
-        #    self.cacheMiss += 1
-        #print "hit: %d / miss: %d" % (self.cacheHit, self.cacheMiss)
+        i = index - self.cacheFrom
+        if 0 <= i < len(self.cachedObjects):
+            self.cacheHits += 1
+            return self.cachedObjects[i]
+
+        # Rows are mostly visited in order, so grow the cache while they are. Otherwise
+        # start it again from this row.
+        self.cacheMisses += 1
+        modelObject = self.objectGetter(index)
+        if i == len(self.cachedObjects) and i < self.cacheSize:
+            self.cachedObjects.append(modelObject)
+        else:
+            self.cachedObjects = [modelObject]
+            self.cacheFrom = index
+        return modelObject
+
 
-        # Cache the last result (the hit rate is normally good: 5-10 hits to 1 miss)
-        if index != self.lastGetObjectIndex:
-            self.lastGetObjectIndex = index
-            self.lastGetObject = self.objectGetter(index)
+    def GetCacheStats(self):
+        """
+        Return a dictionary describing how well GetObjectAt() is served by its cache:
+
+            * hits: the calls answered from the cache
+            * misses: the calls that went to the object getter
+            * prefetched: the rows fetched ahead of being asked for
+            * size: the number of rows in the cache now
+        """
+        return {
+            "hits": self.cacheHits,
+            "misses": self.cacheMisses,
+            "prefetched": self.cachePrefetched,
+            "size": len(self.cachedObjects),
+        }
+
+
+    def _ForgetCachedObjects(self):
+        """
+        Forget the model objects cached for rows, since they may have changed or moved
+        """
+        self.cachedObjects = list()
+        self.cacheFrom = 0
+
+    #----------------------------------------------------------------------------
+    # Event handling
+
+    def _HandleCacheHint(self, evt):
+        """
+        The control is about to draw the given rows. Fetch their model objects in one go.
+        """
+        evt.Skip()
+        if self.objectGetter is None:
+            return
 
-        return self.lastGetObject
+        first = max(0, evt.GetCacheFrom() - self.cacheMargin)
+        last = min(self.GetItemCount(), evt.GetCacheTo() + 1 + self.cacheMargin)
+        self.cacheSize = max(self.cacheSize, last - first)
+
+        # Keep the rows we already have. After a jump, there are none to keep.
+        oldObjects = self.cachedObjects
+        oldFrom = self.cacheFrom
+        cachedObjects = list()
+        for index in xrange(first, last):
+            i = index - oldFrom
+            if 0 <= i < len(oldObjects):
+                cachedObjects.append(oldObjects[i])
+            else:
+                self.cachePrefetched += 1
+                cachedObjects.append(self.objectGetter(index))
+        self.cachedObjects = cachedObjects
+        self.cacheFrom = first
 
 
 
@@ -2273,6 +2615,10 @@ class FastObjectListView(AbstractVirtualObjectListView):
     sorting and selection by object.
     """
 
+    """When adding more than this fraction of the objects already in the list, it is
+    quicker to sort them all again than to insert them one by one"""
+    MAX_INSERTED_FRACTION = 0.125
+
     def __init__(self, *args, **kwargs):
 
         AbstractVirtualObjectListView.__init__(self, *args, **kwargs)
@@ -2286,6 +2632,10 @@ class FastObjectListView(AbstractVirtualObjectListView):
         """
         Add the given collections of objects to our collection of objects.
         """
+        self._AddToIndexes(modelObjects)
+        if self._CanInsertObjects(modelObjects):
+            return self._InsertObjects(modelObjects)
+
         self.modelObjects.extend(modelObjects)
         # We don't want to call RepopulateList() here since that makes the whole
         # control redraw, which flickers slightly, which I *really* hate! So we
@@ -2310,18 +2660,146 @@ class FastObjectListView(AbstractVirtualObjectListView):
             self.RefreshItems(first, self.GetItemCount() - 1)
 
 
+    def _CanInsertObjects(self, modelObjects):
+        """
+        Can the given objects be inserted at their places, leaving the rest of the list as it is?
+        """
+        if len(modelObjects) > len(self.modelObjects) * self.MAX_INSERTED_FRACTION:
+            return False
+
+        # The filter must decide on each object by itself, so the new objects can be
+        # filtered on their own
+        if self.filter is not None and not getattr(self.filter, "perObject", False):
+            return False
+
+        # The list must be sorted the way it should be, so we can find where things go
+        sortColumn = self.GetSortColumn()
+        if sortColumn is None:
+            return True
+        secondarySortColumn = self.GetSecondarySortColumn()
+        if secondarySortColumn == sortColumn:
+            secondarySortColumn = None
+        return self.modelObjectsSortedBy == (sortColumn, secondarySortColumn, self.sortAscending)
+
+
+    def _InsertObjects(self, modelObjects):
+        """
+        Insert the given objects at their sorted places in our model objects and in
+        the visible list, and redraw from the first of them down.
+
+        This costs O(k log n) key lookups for k objects added to n objects, see _InsertSorted().
+        """
+        sortColumn = self.GetSortColumn()
+        if sortColumn is None:
+            keyFunc = None
+        else:
+            keyFunc = self._GetSortKeyFunc(sortColumn, self.modelObjectsSortedBy[1])
+
+        # Without a filter, the visible list is our model objects
+        if self.innerList is self.modelObjects:
+            first = self._InsertSorted(self.modelObjects, modelObjects, keyFunc)
+        else:
+            self._InsertSorted(self.modelObjects, modelObjects, keyFunc)
+            first = self._InsertSorted(self.innerList, self.filter(modelObjects), keyFunc)
+
+        # Only the rows from the first new one on have moved
+        if self.objectToIndexMap is not None:
+            if self.objectToIndexMapStaleFrom is None:
+                self.objectToIndexMapStaleFrom = first
+            else:
+                self.objectToIndexMapStaleFrom = min(first, self.objectToIndexMapStaleFrom)
+
+        self._ForgetCachedObjects()
+        self.SetItemCount(len(self.innerList))
+        if first < self.GetItemCount():
+            self.RefreshItems(first, self.GetItemCount() - 1)
+
+
+    def _InsertSorted(self, aList, modelObjects, keyFunc, ascending=None):
+        """
+        Insert the given objects into aList, which is sorted by keyFunc in the given direction
+        (defaults to our sort order). Objects go after any equal ones, as if aList had been
+        extended and sorted again.
+
+        Return the index of the first object inserted, or len(aList) if there were none.
+
+        For k objects inserted into n, this costs O(k log k + k log n) key lookups, and
+        the objects of aList from the first insertion on are moved once.
+        """
+        if keyFunc is None:
+            first = len(aList)
+            aList.extend(modelObjects)
+            return first
+
+        if ascending is None:
+            ascending = self.sortAscending
+        newObjects = sorted(modelObjects, key=keyFunc, reverse=(not ascending))
+        if not newObjects:
+            return len(aList)
+
+        # Find where each object goes: before the first object that it sorts before,
+        # but no earlier than where the object before it goes
+        places = list()
+        lo = 0
+        for x in newObjects:
+            key = keyFunc(x)
+            hi = len(aList)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                midKey = keyFunc(aList[mid])
+                if (key < midKey) if ascending else (midKey < key):
+                    hi = mid
+                else:
+                    lo = mid + 1
+            places.append(lo)
+
+        # Then merge them with the rest of the list in one pass
+        first = places[0]
+        merged = list()
+        start = first
+        for (place, x) in zip(places, newObjects):
+            merged.extend(aList[start:place])
+            merged.append(x)
+            start = place
+        merged.extend(aList[start:])
+        aList[first:] = merged
+        return first
+
+
+    def RemoveObjects(self, modelObjects):
+        """
+        Remove the given collections of objects from our collection of objects.
+
+        Only the rows from the first removed object down are redrawn.
+        """
+        selection = self.GetSelectedObjects()
+        self._ForgetKeys(modelObjects)
+        self._RemoveFromIndexes(modelObjects)
+        indices = self._RemoveFromInnerList(modelObjects)
+        if self.innerList is not self.modelObjects:
+            self._RemoveFromList(self.modelObjects, modelObjects)
+        if not indices:
+            return
+
+        self.SetItemCount(len(self.innerList))
+        if indices[0] < self.GetItemCount():
+            self.RefreshItems(indices[0], self.GetItemCount() - 1)
+        self.SelectObjects(selection)
+
+
     def RepopulateList(self):
         """
         Completely rebuild the contents of the list control
         """
-        self.lastGetObjectIndex = -1
+        self._ForgetCachedObjects()
         self.Freeze()
         try:
             self._SortObjects()
             self._BuildInnerList()
             wx.ListCtrl.DeleteAllItems(self)
             self.SetItemCount(len(self.innerList))
-            self.RefreshObjects()
+            # Redraw without RefreshObjects(), which would forget the keys of every object
+            self.RefreshItems(0, self.GetItemCount() - 1)
 
             # Auto-resize once all the data has been added
             self.AutoSizeColumns()
@@ -2332,7 +2810,8 @@ class FastObjectListView(AbstractVirtualObjectListView):
         """
         Refresh all the objects in the given list
         """
-        self.lastGetObjectIndex = -1
+        self._ForgetKeys(aList or None)
+        self._ForgetCachedObjects()
         # If no list is given, refresh everything
         if aList:
             for x in aList:
@@ -2353,6 +2832,21 @@ class FastObjectListView(AbstractVirtualObjectListView):
         # In a FastListView, the model index is the same as the list index
         return modelIndex
 
+
+    def _GetSearchIndex(self, searchColumn):
+        """
+        Return the index of the search keys of the given column, building it from all
+        our model objects the first time it is wanted. Return None if the column doesn't
+        want an index.
+        """
+        if not searchColumn.useSearchIndex:
+            return None
+        index = self.searchIndexes.get(searchColumn)
+        if index is None:
+            index = self.searchIndexes[searchColumn] = _SearchKeyIndex(searchColumn)
+            index.Add(self.modelObjects)
+        return index
+
     #----------------------------------------------------------------------------
     #  Sorting
 
@@ -2366,7 +2860,8 @@ class FastObjectListView(AbstractVirtualObjectListView):
         self._SortObjects()
 
         self.SelectObjects(selection)
-        self.RefreshObjects()
+        self._ForgetCachedObjects()
+        self.RefreshItems(0, self.GetItemCount() - 1)
 
 
 #######################################################################
@@ -2417,6 +2912,9 @@ class GroupListView(FastObjectListView):
             If it is changed, SetColumns() must be called again.
         """
         self.groups = list()
+        self.groupsFromObjects = False # were our groups built from our model objects?
+        self.groupsSortedBy = None # (groups, _GetGroupSortOrder()) when we sorted them
+        self.groupsBuiltBy = None # grouping column when _BuildGroups() last built them
         self.showGroups = True
         self.putBlankLineBetweenGroups = True
         self.alwaysGroupByColumnIndex = -1
@@ -2552,11 +3050,121 @@ class GroupListView(FastObjectListView):
     def AddObjects(self, modelObjects):
         """
         Add the given collections of objects to our collection of objects.
+
+        While our groups are sorted the way they would be now, the objects are put
+        straight into their groups. Otherwise the groups are built again.
         """
+        self._AddToIndexes(modelObjects)
+        if self._CanUpdateGroups(modelObjects) and self._AddToGroups(modelObjects):
+            return
+
         self.groups = None
         FastObjectListView.AddObjects(self, modelObjects)
 
 
+    def _CanInsertObjects(self, modelObjects):
+        """
+        Our visible list is built from groups, so new objects can't simply be inserted into it
+        """
+        return False
+
+
+    def _CanUpdateGroups(self, modelObjects):
+        """
+        Can the given objects be added to or removed from our groups, leaving the rest of
+        the groups as they are?
+        """
+        if not self.showGroups or not self.groupsFromObjects or not self.groups:
+            return False
+
+        if len(modelObjects) > len(self.modelObjects) * self.MAX_INSERTED_FRACTION:
+            return False
+
+        # The filter must decide on each object by itself
+        if self.filter is not None and not getattr(self.filter, "perObject", False):
+            return False
+
+        # The groups must have been built by the column we group by now. Sorting by
+        # another column doesn't build them again.
+        if self.groupsBuiltBy != self.GetGroupByColumn():
+            return False
+
+        # The groups must still be sorted the way they would be sorted now
+        sortedBy = self.groupsSortedBy
+        return (sortedBy is not None and sortedBy[0] is self.groups and
+                sortedBy[1:] == self._GetGroupSortOrder())
+
+
+    def _AddToGroups(self, modelObjects):
+        """
+        Put the given objects into their sorted places within their groups, creating the
+        new groups they need.
+
+        Return False, having changed nothing, if a GROUP_CREATING handler changes the new groups.
+        """
+        (groupingColumn, sortColumn, secondarySortColumn, ascending) = self.groupsSortedBy[1:]
+        if sortColumn is None:
+            keyFunc = None
+        else:
+            keyFunc = self._GetSortKeyFunc(sortColumn, secondarySortColumn)
+        if self.filter:
+            visible = self.filter(modelObjects)
+        else:
+            visible = modelObjects
+
+        newGroupMap = dict()
+        added = collections.OrderedDict() # existing group -> its new objects
+        newGroups = list()
+        for model in visible:
+            key = groupingColumn.GetGroupKey(model)
+            group = self.innerList.GetGroupWithKey(key) or newGroupMap.get(key)
+            if group is None:
+                newGroupMap[key] = group = ListGroup(key, groupingColumn.GetGroupKeyAsString(key))
+                newGroups.append(group)
+            added.setdefault(group, list()).append(model)
+
+        # Fill the new groups and let the world know about them
+        for group in newGroups:
+            self._InsertSorted(group.modelObjects, added.pop(group), keyFunc)
+        if newGroups:
+            if self.GetShowItemCounts():
+                self._BuildGroupTitles(newGroups, groupingColumn)
+            evt = OLVEvent.GroupCreationEvent(self, list(newGroups))
+            self.GetEventHandler().ProcessEvent(evt)
+            if evt.groups != newGroups:
+                return False
+
+        # Rows change from the title of the first group that changes down
+        rows = self.innerList
+        first = len(rows)
+        for group in newGroups:
+            rows.ObjectsAdded(group, group.modelObjects)
+        for (group, models) in added.iteritems():
+            first = min(first, rows.GetOffset(group))
+            self._InsertSorted(group.modelObjects, models, keyFunc)
+            rows.ObjectsAdded(group, models)
+        if self.GetShowItemCounts():
+            self._BuildGroupTitles(added.keys(), groupingColumn)
+
+        if newGroups:
+            groups = list(self.groups)
+            self._InsertSorted(groups, newGroups, self._GetGroupSortKey, ascending)
+            # The first new group goes before the old group now at its index, and before
+            # the blank line before that
+            isNew = set(newGroups)
+            i = min(j for (j, group) in enumerate(groups) if group in isNew)
+            if i < len(self.groups):
+                first = min(first, rows.GetOffset(self.groups[i]) - (1 if i > 0 and rows.blank else 0))
+            self.groups[:] = groups
+            rows.Rebuild()
+        else:
+            rows.Update(added.keys())
+
+        self.modelObjects.extend(modelObjects)
+        self._RefreshFrom(first)
+        return True
+
+
     def CreateCheckStateColumn(self, columnIndex=0):
         """
         Create a fixed width column at the given index to show the checkedness
@@ -2572,19 +3180,88 @@ class GroupListView(FastObjectListView):
     def RemoveObjects(self, modelObjects):
         """
         Remove the given collections of objects from our collection of objects.
+
+        Where it can, this takes the objects out of their groups, and groups left empty
+        out of the list. Otherwise the groups are built again.
         """
-        self.groups = None
-        FastObjectListView.RemoveObjects(self, modelObjects)
+        selection = self.GetSelectedObjects()
+        self._ForgetKeys(modelObjects)
+        self._RemoveFromIndexes(modelObjects)
+        if not (self._CanUpdateGroups(modelObjects) and self._RemoveFromGroups(modelObjects)):
+            self._RemoveFromList(self.modelObjects, modelObjects)
+            self.groups = None
+            self.RepopulateList()
+        self.SelectObjects(selection)
 
 
-    def SetColumns(self, columns, repopulate=True):
+    def _RemoveFromGroups(self, modelObjects):
         """
-        Set the columns for this control.
+        Take the given objects out of their groups, dropping the groups that are left empty.
+
+        Return False, having changed nothing, if some object isn't in the group its
+        group key says (its key has changed since it was grouped).
         """
-        newColumns = columns[:]
-        # Insert the column used for expansion and contraction (if one isn't already there)
-        if self.showGroups and self.useExpansionColumn and len(newColumns) > 0:
-            if not isinstance(newColumns[0], ColumnDefn) or not newColumns[0].isInternal:
+        groupingColumn = self.groupsSortedBy[1]
+        if self.filter:
+            visible = self.filter(modelObjects)
+        else:
+            visible = modelObjects
+
+        removed = collections.OrderedDict() # group -> {id: object} of its removed objects
+        for model in visible:
+            group = self.innerList.GetGroupWithKey(groupingColumn.GetGroupKey(model))
+            if group is None:
+                return False
+            removed.setdefault(group, dict())[id(model)] = model
+
+        remaining = dict()
+        for (group, ids) in removed.iteritems():
+            remaining[group] = [x for x in group.modelObjects if id(x) not in ids]
+            if len(group.modelObjects) - len(remaining[group]) != len(ids):
+                return False
+
+        # Rows change from the title (or the blank line before it) of the first group
+        # that changes down
+        rows = self.innerList
+        first = len(rows)
+        emptied = set()
+        for group in removed:
+            first = min(first, rows.GetOffset(group) - (1 if rows.positions[group] > 0 and rows.blank else 0))
+            group.modelObjects = remaining[group]
+            rows.ObjectsRemoved(group, removed[group].itervalues())
+            if not group.modelObjects:
+                emptied.add(group)
+        if self.GetShowItemCounts():
+            self._BuildGroupTitles([x for x in removed if x not in emptied], groupingColumn)
+
+        if emptied:
+            self.groups[:] = [x for x in self.groups if x not in emptied]
+            rows.Rebuild()
+        else:
+            rows.Update(removed.keys())
+
+        self._RemoveFromList(self.modelObjects, modelObjects)
+        self._RefreshFrom(first)
+        return True
+
+
+    def _RefreshFrom(self, first):
+        """
+        Our rows have changed from the given index down. Redraw them.
+        """
+        self.SetItemCount(len(self.innerList))
+        if first < self.GetItemCount():
+            self.RefreshItems(first, self.GetItemCount() - 1)
+
+
+    def SetColumns(self, columns, repopulate=True):
+        """
+        Set the columns for this control.
+        """
+        newColumns = columns[:]
+        # Insert the column used for expansion and contraction (if one isn't already there)
+        if self.showGroups and self.useExpansionColumn and len(newColumns) > 0:
+            if not isinstance(newColumns[0], ColumnDefn) or not newColumns[0].isInternal:
                 newColumns.insert(0, ColumnDefn("", fixedWidth=24, isEditable=False))
                 newColumns[0].isInternal = True
         FastObjectListView.SetColumns(self, newColumns, repopulate)
@@ -2598,6 +3275,7 @@ class GroupListView(FastObjectListView):
         """
         self.modelObjects = list()
         self.SetShowGroups(True)
+        self.groupsFromObjects = False
         self._SetGroups(groups)
 
 
@@ -2648,6 +3326,7 @@ class GroupListView(FastObjectListView):
             modelObjects = self.filter(modelObjects)
 
         groupingColumn = self.GetGroupByColumn()
+        self.groupsBuiltBy = groupingColumn
 
         groupMap = {}
         for model in modelObjects:
@@ -2666,6 +3345,7 @@ class GroupListView(FastObjectListView):
         evt = OLVEvent.GroupCreationEvent(self, groups)
         self.GetEventHandler().ProcessEvent(evt)
 
+        self.groupsFromObjects = True
         return evt.groups
 
 
@@ -2682,7 +3362,8 @@ class GroupListView(FastObjectListView):
         Build the list that will be used to populate the ListCtrl.
 
         This internal list is an amalgum of model objects, ListGroups
-        and None (which are blank rows).
+        and None (which are blank rows). When showing groups, it is worked out from
+        the groups as rows are asked for (see _GroupRows).
         """
         self.objectToIndexMap = None
         if not self.showGroups:
@@ -2690,20 +3371,11 @@ class GroupListView(FastObjectListView):
 
         if not self.modelObjects:
             self.groups = list()
-            self.innerList = list()
-            return
-
-        if self.groups is None:
+        elif self.groups is None:
             self.groups = self._BuildGroups()
             self.SortGroups()
 
-        self.innerList = list()
-        for grp in self.groups:
-            if len(self.innerList) and self.putBlankLineBetweenGroups:
-                self.innerList.append(None)
-            self.innerList.append(grp)
-            if grp.isExpanded:
-                self.innerList.extend(grp.modelObjects)
+        self.innerList = _GroupRows(self.groups, self.putBlankLineBetweenGroups)
 
     #----------------------------------------------------------------------------
     # Virtual list callbacks.
@@ -2853,7 +3525,7 @@ class GroupListView(FastObjectListView):
         # Expand/contract the groups, then put those changes into effect
         for x in evt.groups:
             x.isExpanded = isExpanding
-        self._BuildInnerList()
+        self.innerList.Update(evt.groups)
         self.SetItemCount(len(self.innerList))
 
         # Refresh eveything from the first group down
@@ -2911,12 +3583,48 @@ class GroupListView(FastObjectListView):
         Return the group that contains the given object or None if the given
         object is not found
         """
+        # Our rows know the group of every object that can be hashed
+        if isinstance(self.innerList, _GroupRows):
+            try:
+                return self.innerList.GetGroupOf(modelObject)
+            except TypeError:
+                pass
+
         for group in self.groups:
             if modelObject in group.modelObjects:
                 return group
         return None
 
 
+    def GetIndexOf(self, modelObject):
+        """
+        Return the index of the given modelObject, or ListGroup, in the list.
+
+        Objects in collapsed groups, and blank rows, have no index.
+        """
+        if not self.showGroups or not isinstance(self.innerList, _GroupRows):
+            return FastObjectListView.GetIndexOf(self, modelObject)
+
+        if modelObject is None:
+            return -1
+        if isinstance(modelObject, ListGroup):
+            try:
+                return self.innerList.GetOffset(modelObject)
+            except KeyError:
+                return -1
+
+        try:
+            return self.innerList.GetIndexOf(modelObject)
+        except TypeError:
+            pass
+
+        # Objects that cannot be hashed have to be looked for
+        group = self.FindGroupFor(modelObject)
+        if group is None or not group.isExpanded:
+            return -1
+        return self.innerList.GetOffset(group) + 1 + group.modelObjects.index(modelObject)
+
+
     def GetSelectedGroups(self):
         """
         Return a list of the groups that are selected
@@ -2982,13 +3690,20 @@ class GroupListView(FastObjectListView):
         return not self.showGroups
 
 
-    def _GetValuesAsMultiList(self, objects):
+    def _GetExportColumns(self):
         """
-        Return a list of lists of the string of the aspects of the given objects
+        Return the columns whose values are copied or exported
+        """
+        return self.columns[self.GetPrimaryColumnIndex():] # We don't want to copy the expand icon columns
+
+
+    def YieldValues(self, objects):
+        """
+        Progressively yield a list of the strings of the aspects of each of the given
+        objects, skipping blank lines and ListGroups
         """
-        cols = self.columns[self.GetPrimaryColumnIndex():] # We don't want to copy the expand icon columns
-        objects = [x for x in objects if x is not None and not isinstance(x, ListGroup)]
-        return [[column.GetStringValue(x) for column in cols] for x in objects]
+        objects = (x for x in objects if x is not None and not isinstance(x, ListGroup))
+        return FastObjectListView.YieldValues(self, objects)
 
 
     #----------------------------------------------------------------------------
@@ -3047,10 +3762,9 @@ class GroupListView(FastObjectListView):
 
         # If the groups are locked, we sort by the sort column, otherwise by the grouping column.
         # The primary column is always used as a secondary sort key.
-        if self.GetAlwaysGroupByColumn():
-            sortCol = self.GetSortColumn()
-        else:
-            sortCol = self.GetGroupByColumn()
+        order = self._GetGroupSortOrder(ascending)
+        sortCol = order[1]
+        self.groupsSortedBy = None
 
         # Let the world have a change to sort the items
         evt = OLVEvent.SortGroupsEvent(self, groups, sortCol, ascending)
@@ -3059,17 +3773,42 @@ class GroupListView(FastObjectListView):
             return
 
         # Sorting event wasn't handled, so we do the default sorting
-        def _getLowerCaseKey(group):
-            try:
-                return group.key.lower()
-            except:
-                return group.key
-
-        groups.sort(key=_getLowerCaseKey, reverse=(not ascending))
+        groups.sort(key=self._GetGroupSortKey, reverse=(not ascending))
 
         # Sort the model objects within each group.
-        for x in groups:
-            self._SortObjects(x.modelObjects, sortCol, self.GetPrimaryColumn())
+        sortedHere = [self._SortObjects(x.modelObjects, sortCol, self.GetPrimaryColumn())
+                      for x in groups]
+
+        # Remember how, so objects can later be put straight into their places
+        if sortCol is None or all(sortedHere):
+            self.groupsSortedBy = (groups,) + order
+
+
+    def _GetGroupSortKey(self, group):
+        """
+        Return the key by which the given group sorts
+        """
+        try:
+            return group.key.lower()
+        except:
+            return group.key
+
+
+    def _GetGroupSortOrder(self, ascending=None):
+        """
+        Return how our groups are sorted: (grouping column, column the objects of a group
+        are sorted by, secondary sort column, ascending)
+        """
+        if ascending is None:
+            ascending = self.sortAscending
+        if self.GetAlwaysGroupByColumn():
+            sortCol = self.GetSortColumn()
+        else:
+            sortCol = self.GetGroupByColumn()
+        secondarySortCol = self.GetPrimaryColumn()
+        if secondarySortCol == sortCol:
+            secondarySortCol = None
+        return (self.GetGroupByColumn(), sortCol, secondarySortCol, ascending)
 
 
     def _SortItemsNow(self):
@@ -3096,6 +3835,488 @@ class GroupListView(FastObjectListView):
 
 
 
+#######################################################################
+
+class _ColumnSizer(object):
+    """
+    Works out the widths of the auto sizing columns of a list from a bounded sample of
+    its rows, rather than asking the control to measure every row.
+
+    For each column, the sample is the visible rows plus the candidates: the model
+    objects with the longest strings in that column. The first candidates are taken from
+    objects spread through the list, so with more than SAMPLE_SIZE objects the width is
+    an estimate. The candidates are then kept up to date as objects are added, refreshed
+    and removed, and the widths of texts are cached.
+    """
+
+    """How many of the longest strings of each column are kept as candidates"""
+    MAX_CANDIDATES = 50
+
+    """How many model objects the first candidates of a column are taken from"""
+    SAMPLE_SIZE = 1000
+
+    """Forget the cached widths of texts when there are more than this many"""
+    MAX_CACHED_WIDTHS = 10000
+
+    """Room the control leaves around the text of a cell when it autosizes a column. The
+    native control of Windows pads text by 6 pixels each side, the generic one used
+    elsewhere adds a margin of 10 pixels."""
+    if wx.Platform == "__WXMSW__":
+        PADDING = 12
+    else:
+        PADDING = 10
+
+    def __init__(self):
+        self.candidates = dict() # column -> {id(modelObject): (length of its string, modelObject)}
+        self.textWidths = dict() # text -> width in the font given by fontDesc
+        self.fontDesc = None
+
+
+    def Add(self, modelObjects):
+        """
+        Consider the given model objects as candidates
+        """
+        for (column, candidates) in self.candidates.iteritems():
+            for x in modelObjects:
+                candidates[id(x)] = (len(column.GetStringValue(x)), x)
+            if len(candidates) > self.MAX_CANDIDATES * 2:
+                self._Trim(candidates)
+
+
+    def Forget(self, modelObjects):
+        """
+        The strings of the given model objects have changed. Consider them again.
+        """
+        self.Remove(modelObjects)
+        self.Add(modelObjects)
+
+
+    def Remove(self, modelObjects):
+        """
+        The given model objects are no longer in the list
+        """
+        for (column, candidates) in self.candidates.items():
+            for x in modelObjects:
+                candidates.pop(id(x), None)
+            # Once most of the candidates have gone, the next longest strings are unknown
+            if len(candidates) < self.MAX_CANDIDATES / 2:
+                del self.candidates[column]
+
+
+    def Clear(self):
+        """
+        Forget all candidates
+        """
+        self.candidates = dict()
+
+
+    def CalcWidth(self, olv, columnIndex, column):
+        """
+        Return the width the given column needs for its sample of rows, or -1 if there
+        are no rows to measure
+        """
+        texts = set()
+        for (length, x) in self._GetCandidates(olv, column).itervalues():
+            # Filtered objects, or objects in collapsed groups, don't count
+            if olv.GetIndexOf(x) != -1:
+                texts.add(column.GetStringValue(x))
+
+        top = max(olv.GetTopItem(), 0)
+        for row in xrange(top, min(top + olv.GetCountPerPage() + 1, olv.GetItemCount())):
+            x = olv.GetObjectAt(row)
+            if x is not None and not isinstance(x, ListGroup):
+                texts.add(column.GetStringValue(x))
+        if not texts:
+            return -1
+
+        fontDesc = olv.GetFont().GetNativeFontInfoDesc()
+        if fontDesc != self.fontDesc or len(self.textWidths) > self.MAX_CACHED_WIDTHS:
+            self.fontDesc = fontDesc
+            self.textWidths = dict()
+        width = max(self._GetTextWidth(olv, x) for x in texts) + self.PADDING
+        if olv.smallImageList is not None and (column.imageGetter is not None or column.HasCheckState()):
+            width += olv.smallImageList.GetSize(0)[0]
+        return width
+
+
+    def _GetCandidates(self, olv, column):
+        candidates = self.candidates.get(column)
+        if candidates is None:
+            candidates = self.candidates[column] = dict()
+            step = max(1, len(olv.modelObjects) // self.SAMPLE_SIZE)
+            for x in olv.modelObjects[::step]:
+                candidates[id(x)] = (len(column.GetStringValue(x)), x)
+                if len(candidates) > self.MAX_CANDIDATES * 2:
+                    self._Trim(candidates)
+            self._Trim(candidates)
+        return candidates
+
+
+    def _Trim(self, candidates):
+        """
+        Keep only the candidates with the longest strings
+        """
+        longest = heapq.nlargest(self.MAX_CANDIDATES, candidates.iteritems(), key=lambda x: x[1][0])
+        candidates.clear()
+        candidates.update(longest)
+
+
+    def _GetTextWidth(self, olv, text):
+        try:
+            return self.textWidths[text]
+        except KeyError:
+            width = self.textWidths[text] = olv.GetTextExtent(text)[0]
+            return width
+
+
+#######################################################################
+
+class _SearchKeyIndex(object):
+    """
+    The search keys of one column for the model objects of a list, kept sorted so that
+    the objects whose keys start with some text are found by bisection.
+
+    Objects that are added, or whose keys are forgotten, are only put into their sorted
+    places when the index is next searched, so changing many objects between searches
+    costs one sort.
+    """
+
+    """Change more than this many keys at once by rebuilding or resorting the sorted keys"""
+    MAX_IN_PLACE = 64
+
+    def __init__(self, column):
+        self.column = column
+        self.keys = list() # (search key, id(modelObject)), sorted by key
+        self.objects = dict() # id(modelObject) -> modelObject
+        self.objectKeys = dict() # id(modelObject) -> its search key
+        self.pending = dict() # id(modelObject) -> modelObject, to be put into keys
+
+
+    def Add(self, modelObjects):
+        """
+        Index the given model objects
+        """
+        for x in modelObjects:
+            self.pending[id(x)] = x
+
+
+    def Forget(self, modelObjects):
+        """
+        The keys of the given model objects have changed. Index them again.
+        """
+        self._Delete(modelObjects, True)
+
+
+    def Remove(self, modelObjects):
+        """
+        Stop indexing the given model objects
+        """
+        self._Delete(modelObjects, False)
+
+
+    def Find(self, prefix):
+        """
+        Yield the model objects whose search keys start with the given (normalised) prefix,
+        in the order of their keys
+        """
+        self._Flush()
+        keys = self.keys
+        i = bisect.bisect_left(keys, (prefix,))
+        while i < len(keys) and keys[i][0].startswith(prefix):
+            yield self.objects[keys[i][1]]
+            i += 1
+
+
+    def Count(self, prefix):
+        """
+        Return how many model objects have search keys that start with the given
+        (normalised) prefix
+        """
+        self._Flush()
+        keys = self.keys
+        first = lo = bisect.bisect_left(keys, (prefix,))
+        hi = len(keys)
+        # From first on, the keys that start with the prefix come before the others
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if keys[mid][0].startswith(prefix):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - first
+
+
+    def _Delete(self, modelObjects, reindex):
+        deleted = dict()
+        for x in modelObjects:
+            if self.objects.pop(id(x), None) is not None:
+                deleted[id(x)] = self.objectKeys.pop(id(x))
+                if reindex:
+                    self.pending[id(x)] = x
+            elif not reindex:
+                self.pending.pop(id(x), None)
+
+        if len(deleted) > self.MAX_IN_PLACE:
+            self.keys = [x for x in self.keys if x[1] not in deleted]
+            return
+        keys = self.keys
+        for (ident, key) in deleted.iteritems():
+            i = bisect.bisect_left(keys, (key,))
+            while i < len(keys) and keys[i][0] == key:
+                if keys[i][1] == ident:
+                    del keys[i]
+                    break
+                i += 1
+
+
+    def _Flush(self):
+        """
+        Put the pending objects into their sorted places
+        """
+        if not self.pending:
+            return
+        getKey = self.column.GetSearchKey
+        new = list()
+        for (ident, x) in self.pending.iteritems():
+            if ident not in self.objects:
+                key = getKey(x)
+                self.objects[ident] = x
+                self.objectKeys[ident] = key
+                new.append((key, ident))
+        self.pending = dict()
+
+        # Insert a few keys in place, but sort many of them in one go. Objects with the
+        # same key may be in any order, so compare only the keys.
+        if len(new) > self.MAX_IN_PLACE:
+            self.keys.extend(new)
+            self.keys.sort(key=operator.itemgetter(0))
+        else:
+            for x in new:
+                bisect.insort(self.keys, x)
+
+
+#######################################################################
+
+"""Marks the object maps of _GroupRows as impossible to build"""
+_UNHASHABLE = object()
+
+class _GroupRows(object):
+    """
+    The rows of a GroupListView, worked out from its groups rather than stored.
+
+    Each group has a row for its title, one for each of its model objects when it is
+    expanded, and a blank row before it (unless it is the first group) when
+    putBlankLineBetweenGroups is set. A Fenwick tree over these sizes maps a row to
+    its group in O(log G) for G groups, and resizing one group costs O(log G) too.
+
+    The other way, the group of each model object and its offset within the group are
+    kept in maps, so finding the row of an object costs O(log G) as well. These are
+    built as they are first needed, and must be told of the objects that groups gain
+    or lose (see ObjectsAdded() and ObjectsRemoved()).
+
+    Rows are read like a list: rows[i] is a model object, a ListGroup, or None for
+    a blank row.
+    """
+
+    def __init__(self, groups, putBlankLineBetweenGroups=True):
+        self.groups = groups
+        self.blank = putBlankLineBetweenGroups
+        self.objectGroups = None # model object -> its group
+        self.objectOffsets = dict() # group -> {model object -> its index in the group}
+        self.Rebuild()
+
+
+    def __len__(self):
+        return self.length
+
+
+    def __iter__(self):
+        for (i, group) in enumerate(self.groups):
+            if self.blank and i > 0:
+                yield None
+            yield group
+            if group.isExpanded:
+                for x in group.modelObjects:
+                    yield x
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(self.length))]
+        if index < 0:
+            index += self.length
+        if index < 0 or index >= self.length:
+            raise IndexError("row index out of range")
+
+        # Walk down the tree to the number of groups that end at or before the row.
+        # That is the index of the group the row is in.
+        tree = self.tree
+        i = 0
+        step = self.topStep
+        while step:
+            j = i + step
+            if j < len(tree) and tree[j] <= index:
+                i = j
+                index -= tree[j]
+            step >>= 1
+
+        group = self.groups[i]
+        if self.blank and i > 0:
+            if index == 0:
+                return None
+            index -= 1
+        if index == 0:
+            return group
+        return group.modelObjects[index-1]
+
+
+    def Rebuild(self):
+        """
+        Work out all the rows again, after groups have been added, removed or reordered
+        """
+        self.positions = dict((group, i) for (i, group) in enumerate(self.groups))
+        self.groupsByKey = None
+        self._BuildTree()
+
+
+    def _BuildTree(self):
+        self.sizes = [self._GetSize(i, group) for (i, group) in enumerate(self.groups)]
+        self.length = sum(self.sizes)
+
+        # Build the tree in O(G) by passing each node's total up to its parent
+        tree = [0] + self.sizes
+        for i in xrange(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.tree = tree
+        self.topStep = 1
+        while self.topStep * 2 < len(tree):
+            self.topStep *= 2
+
+
+    def Update(self, groups):
+        """
+        Work out the rows of the given groups again, after they have been expanded or
+        collapsed, or have gained or lost model objects
+        """
+        # Changing most of the groups one by one costs more than starting again
+        if len(groups) * 8 > len(self.groups):
+            return self._BuildTree()
+
+        tree = self.tree
+        for group in groups:
+            i = self.positions[group]
+            size = self._GetSize(i, group)
+            delta = size - self.sizes[i]
+            if not delta:
+                continue
+            self.sizes[i] = size
+            self.length += delta
+            j = i + 1
+            while j < len(tree):
+                tree[j] += delta
+                j += j & -j
+
+
+    def GetOffset(self, group):
+        """
+        Return the row of the title of the given group
+        """
+        i = self.positions[group]
+        row = 0
+        j = i
+        while j > 0:
+            row += self.tree[j]
+            j -= j & -j
+        if self.blank and i > 0:
+            row += 1
+        return row
+
+
+    def GetGroupWithKey(self, key):
+        """
+        Return the group with the given key, or None
+        """
+        if self.groupsByKey is None:
+            self.groupsByKey = dict()
+            for group in self.groups:
+                try:
+                    self.groupsByKey.setdefault(group.key, group)
+                except TypeError:
+                    pass
+        try:
+            return self.groupsByKey.get(key)
+        except TypeError:
+            return None
+
+
+    def GetGroupOf(self, modelObject):
+        """
+        Return the group that holds the given model object, or None.
+
+        Raise TypeError if some model object cannot be hashed.
+        """
+        if self.objectGroups is None:
+            self.objectGroups = _UNHASHABLE
+            objectGroups = dict()
+            for group in self.groups:
+                for x in group.modelObjects:
+                    objectGroups[x] = group
+            self.objectGroups = objectGroups
+        if self.objectGroups is _UNHASHABLE:
+            raise TypeError("model objects cannot be hashed")
+        return self.objectGroups.get(modelObject)
+
+
+    def GetIndexOf(self, modelObject):
+        """
+        Return the row of the given model object, or -1 if it is not in an expanded group.
+
+        Raise TypeError if some model object cannot be hashed.
+        """
+        group = self.GetGroupOf(modelObject)
+        if group is None or not group.isExpanded:
+            return -1
+        offsets = self.objectOffsets.get(group)
+        if offsets is None:
+            offsets = dict((x, i) for (i, x) in enumerate(group.modelObjects))
+            self.objectOffsets[group] = offsets
+        return self.GetOffset(group) + 1 + offsets[modelObject]
+
+
+    def ObjectsAdded(self, group, modelObjects):
+        """
+        Note that the given model objects have been put into the given group
+        """
+        self.objectOffsets.pop(group, None)
+        if isinstance(self.objectGroups, dict):
+            try:
+                for x in modelObjects:
+                    self.objectGroups[x] = group
+            except TypeError:
+                self.objectGroups = _UNHASHABLE
+
+
+    def ObjectsRemoved(self, group, modelObjects):
+        """
+        Note that the given model objects have been taken out of the given group
+        """
+        self.objectOffsets.pop(group, None)
+        if isinstance(self.objectGroups, dict):
+            for x in modelObjects:
+                self.objectGroups.pop(x, None)
+
+
+    def _GetSize(self, i, group):
+        size = 1
+        if group.isExpanded:
+            size += len(group.modelObjects)
+        if self.blank and i > 0:
+            size += 1
+        return size
+
+
 #######################################################################
 
 class ListGroup(object):
@@ -3129,7 +4350,8 @@ class ColumnDefn(object):
                  checkStateGetter=None, checkStateSetter=None,
                  isSearchable=True, useBinarySearch=None, headerImage=-1,
                  groupKeyGetter=None, groupKeyConverter=None, useInitialLetterForGroupKey=False,
-                 groupTitleSingleItem=None, groupTitlePluralItems=None):
+                 groupTitleSingleItem=None, groupTitlePluralItems=None, searchFolding=False,
+                 useSearchIndex=False):
         self.title = title
         self.align = align
         self.valueGetter = valueGetter
@@ -3142,6 +4364,11 @@ class ColumnDefn(object):
         self.isEditable = isEditable
         self.isSearchable = isSearchable
         self.useBinarySearch = useBinarySearch
+        self.useSearchIndex = useSearchIndex # index the search keys for typing into an unsorted list?
+        self.searchFolding = searchFolding # also fold accents and widths when searching?
+        self.searchKeys = {} # modelObject -> normalised string value, see GetSearchKey()
+        self.sortKeys = {} # modelObject -> key it sorts by, see GetSortKey()
+        self.accessors = {} # munger -> class of modelObject -> accessor, see _Munge()
         self.headerImage = headerImage
         self.groupKeyGetter = groupKeyGetter
         self.groupKeyConverter = groupKeyConverter
@@ -3199,6 +4426,14 @@ class ColumnDefn(object):
         """
         Return the value for this column from the given modelObject
         """
+        # This is the innermost loop of sorting, filtering and drawing, so use the
+        # accessor for the valueGetter directly if there is one
+        try:
+            value = self.accessors[self.valueGetter][modelObject.__class__](modelObject)
+            if value is not None:
+                return value
+        except (TypeError, AttributeError, LookupError):
+            pass
         return self._Munge(modelObject, self.valueGetter)
 
 
@@ -3210,6 +4445,92 @@ class ColumnDefn(object):
         return self._StringToValue(value, self.stringConverter)
 
 
+    def GetSearchKey(self, modelObject):
+        """
+        Return the normalised string value of this column for the given modelObject.
+        Searches compare these keys against text given to NormaliseSearchText().
+
+        Keys are cached, so they must be forgotten (see ForgetKeys()) when the
+        value of the modelObject changes.
+        """
+        try:
+            return self.searchKeys[modelObject]
+        except KeyError:
+            key = self.searchKeys[modelObject] = self.NormaliseSearchText(self.GetStringValue(modelObject))
+            return key
+        except TypeError:
+            # Model objects that can't be hashed can't be cached
+            return self.NormaliseSearchText(self.GetStringValue(modelObject))
+
+
+    def GetSortKey(self, modelObject):
+        """
+        Return the key by which the given modelObject sorts in this column.
+
+        Strings sort without regard to case, in the order of the current locale.
+        Like search keys, sort keys are cached until forgotten by ForgetKeys().
+        """
+        try:
+            return self.sortKeys[modelObject]
+        except KeyError:
+            key = self.sortKeys[modelObject] = self._MakeSortKey(self.GetValue(modelObject))
+            return key
+        except TypeError:
+            # Model objects that can't be hashed can't be cached
+            return self._MakeSortKey(self.GetValue(modelObject))
+
+
+    def _MakeSortKey(self, value):
+        """
+        Return the key by which the given value sorts
+        """
+        # It is more efficient to try to call lower() and catch the exception than it
+        # is to test for the class
+        try:
+            value = value.lower()
+        except AttributeError:
+            return value
+        # strxfrm() only takes byte strings
+        if isinstance(value, unicode):
+            value = value.encode("utf-8")
+        try:
+            return locale.strxfrm(value)
+        except (ValueError, locale.Error):
+            return value
+
+
+    def ForgetKeys(self, modelObjects=None):
+        """
+        Forget the cached search and sort keys of the given model objects, or of all
+        model objects
+        """
+        if modelObjects is None:
+            self.searchKeys = {}
+            self.sortKeys = {}
+            return
+        for x in modelObjects:
+            try:
+                self.searchKeys.pop(x, None)
+                self.sortKeys.pop(x, None)
+            except TypeError:
+                pass
+
+
+    def NormaliseSearchText(self, text):
+        """
+        Return the given text as searches compare it: lowercased and, if searchFolding
+        is set, without accents and with full width characters folded to normal width.
+        """
+        if not self.searchFolding:
+            return text.lower()
+        if not isinstance(text, unicode):
+            text = text.decode("utf-8", "replace")
+        # NFKD splits accents into combining marks and folds widths. NFC puts back
+        # together what remains, like hangul syllables.
+        text = u"".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+        return unicodedata.normalize("NFC", text).lower()
+
+
     def _StringToValue(self, value, converter):
         """
         Convert the given value to a string, using the given converter
@@ -3298,6 +4619,7 @@ class ColumnDefn(object):
         """
         Set this columns aspect of the given modelObject to have the given value.
         """
+        self.ForgetKeys([modelObject])
         if self.valueSetter is None:
             return self._SetValueUsingMunger(modelObject, value, self.valueGetter, False)
         else:
@@ -3364,10 +4686,61 @@ class ColumnDefn(object):
 
         3) an index (string or integer) onto the modelObject.
            This allows dictionary-like objects and list-like objects to be used directly.
+
+        Which of these applies is worked out once per munger and class of model object,
+        and remembered as an accessor. The accessor is used from then on, unless it fails
+        or finds None, when the value is looked for again the long way.
         """
         if munger is None:
             return None
 
+        try:
+            accessor = self.accessors[munger][modelObject.__class__]
+        except KeyError:
+            accessor = self.accessors.setdefault(munger, {})[modelObject.__class__] = \
+                self._MakeAccessor(modelObject, munger)
+        except TypeError:
+            # Happens when munger can't be hashed
+            return self._MungeGenerically(modelObject, munger)
+
+        try:
+            value = accessor(modelObject)
+        except (TypeError, AttributeError, LookupError):
+            value = None
+        if value is None:
+            return self._MungeGenerically(modelObject, munger)
+        return value
+
+
+    def _MakeAccessor(self, modelObject, munger):
+        """
+        Return a callable that does what _Munge() would do with munger to model objects
+        of the same class as the given one
+        """
+        if isinstance(munger, basestring):
+            attr = getattr(modelObject, munger, None)
+            if attr is not None:
+                if callable(attr):
+                    # A plain method, not hidden by an instance attribute, is best called directly
+                    function = getattr(attr, "im_func", None)
+                    if getattr(attr, "im_self", None) is modelObject and \
+                            munger not in getattr(modelObject, "__dict__", ()):
+                        return function
+                    return operator.methodcaller(munger)
+                return operator.attrgetter(munger)
+            if hasattr(modelObject, munger):
+                # The attribute is None for now. _Munge() will go the long way until it isn't
+                return operator.attrgetter(munger)
+        elif callable(munger):
+            return munger
+        return operator.itemgetter(munger)
+
+
+    def _MungeGenerically(self, modelObject, munger):
+        """
+        Wrest some value from the given modelObject using the munger, without the
+        help of an accessor. See _Munge().
+        """
         # THINK: The following code treats an instance variable with the value of None
         # as if it doesn't exist. Is that best?
 
@@ -3535,6 +4908,10 @@ class BatchedUpdate(object):
         * ``RepopulateList()``
         * ``SetObjects()``
 
+    Changes made between two updates are merged: an object refreshed many times is redrawn
+    once, and an object added and then removed is never shown. ``GetStats()`` reports how
+    many batches were applied, how many changes were merged away and how long applying took.
+
     All other message are passed directly to the ``ObjectListView`` and are thus unbatched. This means
     that sorting and changes to columns are unbatched and will take effect immediately.
 
@@ -3576,12 +4953,21 @@ class BatchedUpdate(object):
 
         self.objectListView.Bind(wx.EVT_IDLE, self._HandleIdle)
 
+        # Pending changes are keyed by id() so that unhashable model objects can be
+        # batched too. Adds are kept in the order they were made.
         self.newModelObjects = BatchedUpdate.NOT_SET
-        self.objectsToAdd = list()
-        self.objectsToRefresh = list()
-        self.objectsToRemove = list()
+        self.objectsToAdd = collections.OrderedDict()
+        self.objectsToRefresh = dict()
+        self.objectsToRemove = dict()
         self.freezeUntil = 0
 
+        # Instrumentation, see GetStats()
+        self.opsRequested = 0 # changes asked for since the last batch was applied
+        self.batchesApplied = 0
+        self.opsCoalesced = 0
+        self.applyDuration = 0 # seconds spent changing the list, in total
+        self.lastApplyDuration = 0 # seconds the last change to the list took
+
 
     def __getattr__(self, name):
         """
@@ -3592,17 +4978,35 @@ class BatchedUpdate(object):
         return getattr(self.objectListView, name)
 
 
+    def GetStats(self):
+        """
+        Return a dictionary describing how well changes have been batched:
+
+            * batches: the number of batches applied to the list
+            * coalesced: the number of changes that cancelled out or were merged
+              into other changes of the same batch
+            * applySeconds: the total time spent changing the list
+            * lastApplySeconds: the time the last change to the list took
+        """
+        return {
+            "batches": self.batchesApplied,
+            "coalesced": self.opsCoalesced,
+            "applySeconds": self.applyDuration,
+            "lastApplySeconds": self.lastApplyDuration,
+        }
+
+
     def RepopulateList(self):
         """
         Remember the given model objects so that they can be displayed when the next update cycle occurs
         """
-        if self.freezeUntil < time.clock():
-            self.objectListView.RepopulateList()
-            self.freezeUntil = time.clock() + self.updatePeriod
+        if not self._IsFrozen():
+            self._ApplyNow(self.objectListView.RepopulateList)
             return
 
+        self.opsRequested += 1
         self.newModelObjects = self.objectListView.modelObjects
-        self.objectsToRefresh = list()
+        self.objectsToRefresh = dict()
 
         # Unlike SetObjects(), refreshing the list does NOT invalidate the objects to be added/removed
 
@@ -3611,16 +5015,16 @@ class BatchedUpdate(object):
         """
         Remember the given model objects so that they can be displayed when the next update cycle occurs
         """
-        if self.freezeUntil < time.clock():
-            self.objectListView.SetObjects(modelObjects)
-            self.freezeUntil = time.clock() + self.updatePeriod
+        if not self._IsFrozen():
+            self._ApplyNow(self.objectListView.SetObjects, modelObjects)
             return
 
+        self.opsRequested += 1
         self.newModelObjects = modelObjects
         # Explicitly setting the objects to be shown renders void any previous Add/Refresh/Remove commands
-        self.objectsToAdd = list()
-        self.objectsToRefresh = list()
-        self.objectsToRemove = list()
+        self.objectsToAdd = collections.OrderedDict()
+        self.objectsToRefresh = dict()
+        self.objectsToRemove = dict()
 
 
     def AddObject(self, modelObject):
@@ -3637,18 +5041,18 @@ class BatchedUpdate(object):
         """
         Remember the given model objects so that they can be added when the next update cycle occurs
         """
-        if self.freezeUntil < time.clock():
-            self.objectListView.AddObjects(modelObjects)
-            self.freezeUntil = time.clock() + self.updatePeriod
+        if not self._IsFrozen():
+            self._ApplyNow(self.objectListView.AddObjects, modelObjects)
             return
 
         # TODO: We should check that none of the model objects is already in the list
-        self.objectsToAdd.extend(modelObjects)
-
-        # Since we are adding these objects, we must no longer remove them
-        if self.objectsToRemove:
-            for x in modelObjects:
-                self.objectsToRemove.remove(x)
+        self.opsRequested += len(modelObjects)
+        for x in modelObjects:
+            # An object that was to be removed is still in the list, so it only needs redrawing
+            if self.objectsToRemove.pop(id(x), None) is not None:
+                self.objectsToRefresh[id(x)] = x
+            else:
+                self.objectsToAdd[id(x)] = x
 
 
     def RefreshObject(self, modelObject):
@@ -3662,17 +5066,20 @@ class BatchedUpdate(object):
         """
         Refresh the information displayed about the given model objects
         """
-        if self.freezeUntil < time.clock():
-            self.objectListView.RefreshObjects(modelObjects)
-            self.freezeUntil = time.clock() + self.updatePeriod
+        if not self._IsFrozen():
+            self._ApplyNow(self.objectListView.RefreshObjects, modelObjects)
             return
 
-        self.objectsToRefresh.extend(modelObjects)
+        # Objects still to be added will be drawn fresh anyway
+        self.opsRequested += len(modelObjects)
+        for x in modelObjects:
+            if id(x) not in self.objectsToAdd:
+                self.objectsToRefresh[id(x)] = x
 
 
-    def RemoveObject(self, modelObjects):
+    def RemoveObject(self, modelObject):
         """
-        Remember the given model objects so that they can be removed when the next update cycle occurs
+        Remember the given model object so that it can be removed when the next update cycle occurs
         """
         self.RemoveObjects([modelObject])
 
@@ -3681,17 +5088,16 @@ class BatchedUpdate(object):
         """
         Remember the given model objects so that they can be removed when the next update cycle occurs
         """
-        if self.freezeUntil < time.clock():
-            self.objectListView.RemoveObjects(modelObjects)
-            self.freezeUntil = time.clock() + self.updatePeriod
+        if not self._IsFrozen():
+            self._ApplyNow(self.objectListView.RemoveObjects, modelObjects)
             return
 
-        self.objectsToRemove.extend(modelObjects)
-
-        # Since we are removing these objects, we must no longer add them
-        if self.objectsToAdd:
-            for x in modelObjects:
-                self.objectsToAdd.remove(x)
+        self.opsRequested += len(modelObjects)
+        for x in modelObjects:
+            self.objectsToRefresh.pop(id(x), None)
+            # Adding and then removing an object leaves the list as it was
+            if self.objectsToAdd.pop(id(x), None) is None:
+                self.objectsToRemove[id(x)] = x
 
     #----------------------------------------------------------------------------
     # Event processing
@@ -3704,32 +5110,78 @@ class BatchedUpdate(object):
             self.objectsToAdd or
             self.objectsToRefresh or
             self.objectsToRemove):
-            if self.freezeUntil < time.clock():
+            if not self._IsFrozen():
                 self._ApplyChanges()
             else:
                 evt.RequestMore()
 
-    def _ApplyChanges(self):
+    def _IsFrozen(self):
         """
-        Apply any batched changes to the list
+        Are changes still to be batched, rather than made straight away?
+
+        Without a monotonic clock, the clock is wall time and may be set back. A freeze
+        ending more than an update period from now can only come from that, and is over.
         """
-        if self.newModelObjects != BatchedUpdate.NOT_SET:
-            self.objectListView.SetObjects(self.newModelObjects)
+        now = _monotonic()
+        return now <= self.freezeUntil <= now + self.updatePeriod
 
-        if self.objectsToAdd:
-            self.objectListView.AddObjects(self.objectsToAdd)
+    def _ApplyNow(self, method, *args):
+        """
+        Make a change to the list straight away, remembering how long it took
+        """
+        start = _monotonic()
+        method(*args)
+        self._Applied(start)
 
-        if self.objectsToRemove:
-            self.objectListView.RemoveObjects(self.objectsToRemove)
+    def _Applied(self, start):
+        """
+        Note that a change to the list, begun at the given time, is done
+        """
+        now = _monotonic()
+        self.lastApplyDuration = max(0, now - start)
+        self.applyDuration += self.lastApplyDuration
+        self.freezeUntil = now + self.updatePeriod
 
-        if self.objectsToRefresh:
-            self.objectListView.RefreshObjects(self.objectsToRefresh)
+    def _ApplyChanges(self):
+        """
+        Apply any batched changes to the list
 
+        Removals, additions and refreshes are handed on as they are, since the list makes
+        those in place. After SetObjects() or RepopulateList(), the other changes are folded
+        into the new list of model objects, which is then shown in one rebuild.
+        """
+        start = _monotonic()
+        olv = self.objectListView
+        toAdd = self.objectsToAdd.values()
+        toRefresh = self.objectsToRefresh.values()
+        toRemove = self.objectsToRemove
+
+        if self.newModelObjects == BatchedUpdate.NOT_SET:
+            applied = len(toRemove) + len(toAdd) + len(toRefresh)
+            if toRemove:
+                olv.RemoveObjects(toRemove.values())
+            if toAdd:
+                olv.AddObjects(toAdd)
+            if toRefresh:
+                olv.RefreshObjects(toRefresh)
+        else:
+            applied = 1
+            modelObjects = self.newModelObjects or list()
+            if toRemove:
+                modelObjects = [x for x in modelObjects if id(x) not in toRemove]
+            if toAdd:
+                modelObjects = modelObjects + toAdd
+            # Every row is redrawn, so the refreshes are covered too
+            olv.SetObjects(modelObjects)
+
+        self.batchesApplied += 1
+        self.opsCoalesced += max(0, self.opsRequested - applied)
+        self.opsRequested = 0
         self.newModelObjects = BatchedUpdate.NOT_SET
-        self.objectsToAdd = list()
-        self.objectsToRemove = list()
-        self.objectsToRefresh = list()
-        self.freezeUntil = time.clock() + self.updatePeriod
+        self.objectsToAdd = collections.OrderedDict()
+        self.objectsToRemove = dict()
+        self.objectsToRefresh = dict()
+        self._Applied(start)
 
 #----------------------------------------------------------------------------
 # Built in images so clients don't have to do the same
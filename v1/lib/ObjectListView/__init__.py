@@ -27,6 +27,7 @@ from OLVEvent import EVT_COLLAPSING, EVT_COLLAPSED, EVT_EXPANDING, EVT_EXPANDED,
 from CellEditor import CellEditorRegistry, MakeAutoCompleteTextBox, MakeAutoCompleteComboBox
 from ListCtrlPrinter import ListCtrlPrinter, ReportFormat, BlockFormat, LineDecoration, RectangleDecoration, ImageDecoration
 
+import Export
 import Filter
 __all__ = [
     "BatchedUpdate",
@@ -48,6 +49,7 @@ __all__ = [
     "EVT_GROUP_CREATING",
     "EVT_GROUP_SORT"
     "EVT_SORT",
+    "Export",
     "Filter",
     "FastObjectListView",
     "GroupListView",
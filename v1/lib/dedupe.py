@@ -0,0 +1,32 @@
+# -*- coding: utf-8-*-
+"""Size-first duplicate detection
+
+Two files can only be duplicates if they have the same size, and most
+books have a size of their own. The walk already knows the size of each
+file, so grouping by size tells the possible duplicates apart without
+reading them. md5 is still the book id, so every file is hashed in the
+end: the split only decides which files are hashed first.
+
+"""
+import collections
+
+
+def size_first(items, size_of, known_sizes=()):
+    """split items into (unique, colliding)
+
+    unique items can't duplicate any other item nor a book of known_sizes,
+    colliding ones may.
+
+    @size_of: get size of an item
+    """
+    by_size = collections.defaultdict(list)
+    for item in items:
+        by_size[size_of(item)].append(item)
+
+    unique, colliding = [], []
+    for size, group in by_size.iteritems():
+        if size in known_sizes or len(group) > 1:
+            colliding.extend(group)
+        else:
+            unique.extend(group)
+    return unique, colliding
@@ -0,0 +1,252 @@
+# -*- coding: utf-8-*-
+"""Inverted index for the search box
+
+SearchIndex keeps, for every 3 character gram of the indexed text, the
+set of objects containing it. A substring query intersects the postings
+of its grams and checks the few candidates left, instead of scanning
+every object; shorter queries scan the lowercased text kept per object.
+Prefix fields (like md5) are kept sorted and matched by bisection.
+
+IndexFilter wraps an index in the ObjectListView filter protocol:
+
+    olv.SetFilter(IndexFilter(SearchIndex([get_title], [get_md5])))
+
+"""
+import bisect
+import threading
+
+GRAM = 3
+
+
+def _grams(text, size=GRAM):
+    return set(text[i:i + size] for i in range(len(text) - size + 1))
+
+
+class SearchIndex(object):
+    """find objects by substring of some fields, or prefix of others
+
+    @text_getters: callables object -> text, matched anywhere
+    @prefix_getters: callables object -> text, matched from their start
+    """
+
+    def __init__(self, text_getters, prefix_getters=()):
+        self.text_getters = text_getters
+        self.prefix_getters = prefix_getters
+        self.texts = {}  # object -> lowercased text fields, '\n' separated
+        self.prefixes = {}  # object -> lowercased prefix fields
+        self.postings = {}  # gram -> set of objects
+        self.sorted_prefixes = []  # sorted (prefix, id(object))
+        self.by_id = {}  # id(object) -> object, to resolve sorted_prefixes
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __contains__(self, obj):
+        return obj in self.texts
+
+    def Missing(self, objects):
+        """Return the given objects which are not indexed"""
+        texts = self.texts
+        return [x for x in objects if x not in texts]
+
+    def Add(self, objects):
+        newPrefixes = []
+        for obj in objects:
+            if obj in self.texts:
+                continue
+            fields = []
+            for get in self.text_getters:
+                value = self._Lower(get(obj))
+                if value not in fields:  # e.g. a title that defaults to the raw name
+                    fields.append(value)
+            text = u'\n'.join(fields)
+            self.texts[obj] = text
+            for gram in _grams(text):
+                try:
+                    self.postings[gram].add(obj)
+                except KeyError:
+                    self.postings[gram] = set([obj])
+
+            prefixes = [self._Lower(get(obj)) for get in self.prefix_getters]
+            self.prefixes[obj] = prefixes
+            self.by_id[id(obj)] = obj
+            newPrefixes.extend((prefix, id(obj)) for prefix in prefixes)
+
+        # Insert a few prefixes in place, but sort many of them in one go
+        if len(newPrefixes) > 64:
+            self.sorted_prefixes.extend(newPrefixes)
+            self.sorted_prefixes.sort()
+        else:
+            for x in newPrefixes:
+                bisect.insort(self.sorted_prefixes, x)
+
+    def Remove(self, objects):
+        for obj in objects:
+            text = self.texts.pop(obj, None)
+            if text is None:
+                continue
+            for gram in _grams(text):
+                posting = self.postings.get(gram)
+                if posting is not None:
+                    posting.discard(obj)
+                    if not posting:
+                        del self.postings[gram]
+
+            for prefix in self.prefixes.pop(obj):
+                i = bisect.bisect_left(self.sorted_prefixes, (prefix, id(obj)))
+                if i < len(self.sorted_prefixes) and self.sorted_prefixes[i] == (prefix, id(obj)):
+                    del self.sorted_prefixes[i]
+            del self.by_id[id(obj)]
+
+    def Refresh(self, objects):
+        """Reindex objects whose fields have changed"""
+        objects = [x for x in objects if x in self.texts]
+        self.Remove(objects)
+        self.Add(objects)
+
+    def Clear(self):
+        self.__init__(self.text_getters, self.prefix_getters)
+
+    def Search(self, text):
+        """Return the set of objects matching text"""
+        text = self._Lower(text)
+        if not text:
+            return set(self.texts)
+
+        found = self._SearchPrefixes(text)
+        if len(text) < GRAM:
+            found.update(x for (x, t) in self.texts.iteritems() if text in t)
+            return found
+
+        postings = []
+        for gram in _grams(text):
+            posting = self.postings.get(gram)
+            if posting is None:
+                return found
+            postings.append(posting)
+        postings.sort(key=len)
+        candidates = postings[0].intersection(*postings[1:])
+
+        # A query no longer than a gram is its own only gram
+        if len(text) == GRAM:
+            found.update(candidates)
+        else:
+            texts = self.texts
+            found.update(x for x in candidates if text in texts[x])
+        return found
+
+    def _SearchPrefixes(self, text):
+        found = set()
+        i = bisect.bisect_left(self.sorted_prefixes, (text,))
+        while i < len(self.sorted_prefixes) and self.sorted_prefixes[i][0].startswith(text):
+            found.add(self.by_id[self.sorted_prefixes[i][1]])
+            i += 1
+        return found
+
+    def _Lower(self, value):
+        if value is None:
+            return u''
+        if not isinstance(value, basestring):
+            value = unicode(value)
+        return value.lower()
+
+
+class IndexFilter(object):
+    """ObjectListView filter backed by a SearchIndex
+
+    Give the filter the objects of the list with AddObjects() as they are
+    set or added, so the index is built before the first search; objects
+    it is asked to filter that are still not indexed are added then. The
+    filter may be given only some objects of the list, so it can't tell
+    which were removed: call RemoveObjects() to drop them, Clear() before
+    the list is given new ones, and RefreshObjects() when the indexed
+    fields of an object change.
+
+    The index may be searched from another thread through Matcher(), and
+    the matches handed back with SetResult().
+    """
+    perObject = True  # see lib.ObjectListView.Filter
+
+    def __init__(self, index, text=""):
+        self.index = index
+        self.text = text
+        self.positions = {}  # object -> index in the last list filtered
+        self.result = None  # (text, list, its length, [(index, object)]) from SetResult
+        self.lock = threading.Lock()
+
+    def __call__(self, modelObjects):
+        if not self.text:
+            return modelObjects
+
+        matches = self._GetResult(modelObjects)
+        if matches is not None:
+            return [x for (i, x) in matches]
+
+        with self.lock:
+            self.index.Add(self.index.Missing(modelObjects))
+            found = self.index.Search(self.text)
+
+        # When many objects match, one pass over the list is cheapest
+        if len(found) * 4 > len(modelObjects):
+            return [x for x in modelObjects if x in found]
+
+        # Otherwise put the few matches in list order by their positions,
+        # rebuilding the positions if the list has changed under them
+        positions = self.positions
+        for x in found:
+            i = positions.get(x)
+            if i is None or i >= len(modelObjects) or modelObjects[i] is not x:
+                self.positions = positions = dict((y, j) for (j, y) in enumerate(modelObjects))
+                break
+        return sorted((x for x in found if x in positions), key=positions.__getitem__)
+
+    def Matcher(self, text, modelObjects):
+        """Return a predicate for the objects matching text, safe off the UI thread"""
+        with self.lock:
+            self.index.Add(self.index.Missing(modelObjects))
+            return self.index.Search(text).__contains__
+
+    def SetResult(self, text, modelObjects, matches):
+        """Match text, taking the [(index, object)] of modelObjects found elsewhere
+
+        The matches are used as long as modelObjects keeps its length and
+        they are still at their index.
+        """
+        self.text = text
+        self.result = (text, modelObjects, len(modelObjects), matches)
+
+    def _GetResult(self, modelObjects):
+        if self.result is None:
+            return None
+        text, source, length, matches = self.result
+        if text != self.text or source is not modelObjects or length != len(modelObjects):
+            return None
+        for (i, x) in matches:
+            if i >= len(modelObjects) or modelObjects[i] is not x:
+                return None
+        return matches
+
+    def Clear(self):
+        """Forget all objects, before the list is given new ones"""
+        with self.lock:
+            self.index.Clear()
+        self.positions = {}
+        self.result = None
+
+    def SetText(self, text):
+        """
+        Set the text that this filter will match. Set this to None or "" to disable the filter.
+        """
+        self.text = text
+
+    def AddObjects(self, objects):
+        with self.lock:
+            self.index.Add(objects)
+
+    def RefreshObjects(self, objects):
+        with self.lock:
+            self.index.Refresh(objects)
+
+    def RemoveObjects(self, objects):
+        with self.lock:
+            self.index.Remove(objects)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8-*-
+"""Debounced background search
+
+Keystrokes only restart a short timer. When typing pauses, the search
+runs on a worker thread over chunks of the list, and gives up between
+chunks as soon as a newer search is scheduled. Only the result of the
+latest search is delivered back, on the UI thread.
+
+    searcher = SearchScheduler(match, show)
+    searcher.search(text, objects)   # on each keystroke
+
+QueryScheduler does the same for searches that are not run over a list,
+like queries to the database.
+
+"""
+import collections
+import threading
+import time
+import Queue
+import wx
+
+
+class SearchScheduler(object):
+    """run the latest search on a worker thread
+
+    @match: match(text, objects) -> predicate on objects. called on the
+        worker thread, so it must not touch wx
+    @deliver: deliver(text, matches, seconds), called on the UI thread
+        with the [(index, object)] matching the latest text
+    @delay: ms to wait for the next keystroke before searching
+    @chunk_size: objects searched between checks for a newer search
+    """
+
+    def __init__(self, match, deliver, delay=150, chunk_size=5000):
+        self.match = match
+        self.deliver = deliver
+        self.delay = delay
+        self.chunk_size = chunk_size
+        self.generation = 0  # bumped by every search, supersedes older ones
+        self.timer = None
+        self.timings = collections.deque(maxlen=100)  # (text, seconds, hits)
+        self.requests = Queue.Queue()
+        self.worker = threading.Thread(target=self._run)
+        self.worker.setDaemon(True)
+        self.worker.start()
+
+    def search(self, text, objects):
+        """schedule a search of objects, superseding any older search"""
+        self.cancel()
+        self.timer = wx.CallLater(self.delay, self.requests.put,
+                                  (self.generation, text, objects))
+
+    def cancel(self):
+        """drop pending and running searches"""
+        self.generation += 1
+        if self.timer is not None:
+            self.timer.Stop()
+            self.timer = None
+
+    def stop(self):
+        self.cancel()
+        self.requests.put(None)
+
+    def _run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            generation, text, objects = request
+            if generation != self.generation:
+                continue
+            start = time.time()
+            matches = self._search(generation, text, objects)
+            if matches is not None:
+                wx.CallAfter(self._deliver, generation, text, matches, time.time() - start)
+
+    def _search(self, generation, text, objects):
+        """[(index, object)] matching text, None once superseded"""
+        predicate = self.match(text, objects)
+        matches = []
+        for begin in xrange(0, len(objects), self.chunk_size):
+            if generation != self.generation:
+                return None
+            chunk = objects[begin:begin + self.chunk_size]
+            matches.extend((begin + i, x) for (i, x) in enumerate(chunk) if predicate(x))
+        return matches
+
+    def _deliver(self, generation, text, matches, seconds):
+        if generation != self.generation:  # superseded while in flight
+            return
+        self.timings.append((text, seconds, len(matches)))
+        self.deliver(text, matches, seconds)
+
+
+class QueryScheduler(SearchScheduler):
+    """run the latest query on a worker thread
+
+    @query: query(text) -> result, with a length. called on the worker
+        thread, so it must not touch wx. it runs to the end once started,
+        but its result is dropped if a newer query was scheduled meanwhile
+    @deliver: deliver(text, result, seconds), called on the UI thread
+    """
+
+    def __init__(self, query, deliver, delay=150):
+        SearchScheduler.__init__(self, query, deliver, delay)
+
+    def search(self, text):
+        SearchScheduler.search(self, text, None)
+
+    def _search(self, generation, text, objects):
+        return self.match(text)
@@ -25,6 +25,12 @@ def md5_for_file(filename, block_size=256*128, hr=True):
     return md5.digest()
 
 
+def fingerprint(filename):
+    """(size, mtime, inode) of a file, cheap to compare across rescans"""
+    st = os.stat(filename)
+    return (st.st_size, st.st_mtime, st.st_ino)
+
+
 def cmd_open_file(filename):
     platform_cmd = {
         'win32': 'start',  # win7 32bit, win7 64bit
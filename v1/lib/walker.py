@@ -0,0 +1,134 @@
+# -*- coding: utf-8-*-
+"""Iterative directory walker
+
+Walks a tree with an explicit stack over scandir entries, so deep trees
+can't hit the recursion limit, and reuses the stat data scandir already
+has: only candidate files are stat'ed, once each.
+
+"""
+import os
+import re
+import sys
+import util
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir  # backport for python 2
+    except ImportError:
+        scandir = None
+if sys.platform.startswith('win'):  # windows
+    import win32con
+
+
+class _Entry(object):
+    """DirEntry look-alike used when scandir is not installed"""
+
+    def __init__(self, dirname, name):
+        self.name = name
+        self.path = os.path.join(dirname, name)
+        self._stat = None
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+    def inode(self):
+        return self.stat().st_ino
+
+    def is_dir(self):
+        return os.path.isdir(self.path)
+
+    def is_file(self):
+        return os.path.isfile(self.path)
+
+    def is_symlink(self):
+        return os.path.islink(self.path)
+
+
+def _listdir(path):
+    return [_Entry(path, name) for name in os.listdir(path)]
+
+
+class Walker(object):
+    """yield target files below a path
+
+    @ignore_seq: names ignored at any depth, e.g. {'.git', 'log'}
+    @ignore_hidden: skip hidden files and directories
+    @ext_pool: extension, or collection of extensions, of target files.
+        a string may hold several, separated by spaces or commas
+    """
+
+    def __init__(self, ignore_seq=None, ignore_hidden=True, ext_pool='.pdf'):
+        if isinstance(ext_pool, basestring):
+            ext_pool = re.split(r'[\s,;]+', ext_pool.strip())
+        self.ignore_seq = frozenset(ignore_seq or ())
+        self.ignore_hidden = ignore_hidden
+        self.ext_pool = frozenset(ext for ext in ext_pool if ext)
+        self.cnt_scanned = 0
+        self.stopFlag = False
+
+    def stop(self):
+        self.stopFlag = True
+
+    def walk(self, src_path, dir_scanned=None):
+        """yield (path, rawname, ext, fingerprint) of target files under src_path
+
+        fingerprint is (size, mtime, inode), see util.fingerprint.
+        dir_scanned(cnt_scanned) is called after each directory is listed.
+
+        @src_path: unicode encoding is required"""
+        if not os.path.exists(src_path):  # not exists
+            return
+        if not os.path.isdir(src_path):  # file
+            rawname, ext = os.path.splitext(os.path.basename(src_path))
+            if ext in self.ext_pool:
+                yield src_path, rawname, ext, util.fingerprint(src_path)
+            return
+
+        listdir = scandir or _listdir
+        linked = set()  # (st_dev, st_ino) of symlinked dirs, guards against loops
+        stack = [src_path]
+        while stack:
+            if self.stopFlag:
+                return
+            try:
+                entries = [entry for entry in listdir(stack.pop())
+                           if entry.name not in self.ignore_seq]
+            except OSError:
+                continue  # unreadable or vanished
+            self.cnt_scanned += len(entries)
+            if dir_scanned is not None:
+                dir_scanned(self.cnt_scanned)
+
+            for entry in entries:
+                if self.stopFlag:
+                    return
+                try:
+                    if self.ignore_hidden and self.is_hidden(entry):
+                        continue
+                    if entry.is_dir():
+                        if entry.is_symlink():
+                            st = entry.stat()
+                            if (st.st_dev, st.st_ino) in linked:
+                                continue
+                            linked.add((st.st_dev, st.st_ino))
+                        stack.append(entry.path)
+                        continue
+                    rawname, ext = os.path.splitext(entry.name)
+                    if ext not in self.ext_pool or not entry.is_file():
+                        continue
+                    st = entry.stat()
+                    yield entry.path, rawname, ext, (st.st_size, st.st_mtime, entry.inode())
+                except OSError:
+                    continue  # broken link or vanished file
+
+    def is_hidden(self, entry):
+        if sys.platform.startswith('win'):  # windows
+            attrs = getattr(entry.stat(), 'st_file_attributes', None)
+            if attrs is None:
+                return util.is_hiden(entry.path)
+            return attrs & win32con.FILE_ATTRIBUTE_HIDDEN
+        else:  # linux
+            return entry.name.startswith('.')
@@ -1,6 +1,11 @@
 # -*- coding: utf-8-*-
+import collections
 import os
+import re
 import shutil
+import sys
+import threading
+import time
 import pymongo
 import lib.util as util
 import settings
@@ -8,8 +13,45 @@ param_template = [('REPO_PATH', None),
                   ('host', 'localhost'),
                   ('port', '27017'),
                   ('db_name', 'bookhub'),
+                  ('max_pool_size', 10),
                   ]
 
+# fields shown in the book list, projection of paged loading
+BOOK_FIELDS = {'md5': 1, 'ext': 1, 'rawname': 1, 'dispname': 1, 'bytes': 1, 'language': 1}
+
+_lock = threading.Lock()
+_clients = {}  # (host, port) -> pooled MongoClient
+_repo = None
+
+
+def path_regex(path):
+    """regex matching path and the paths under it, not /books2 for /books"""
+    path = path.rstrip(os.sep)
+    if not path:
+        return '^' + re.escape(os.sep)  # root
+    return '^%s(?:$|%s)' % (re.escape(path), re.escape(os.sep))
+
+
+def get_client(host, port, max_pool_size):
+    """pooled, thread safe client shared by the whole process"""
+    with _lock:
+        client = _clients.get((host, port))
+        if client is None:
+            client = pymongo.MongoClient(host, port, max_pool_size=max_pool_size)
+            _clients[(host, port)] = client
+        return client
+
+
+def get_repo():
+    """MediaRepo shared by the UI and scan threads"""
+    global _repo
+    if _repo is None:
+        repo = MediaRepo()
+        with _lock:
+            if _repo is None:
+                _repo = repo
+    return _repo
+
 
 class MediaRepo:
 
@@ -22,18 +64,19 @@ class MediaRepo:
         self.hasRepo = os.path.exists(self.repo_path)
 
         # connect to db
-        self.conn = pymongo.Connection(params['host'], int(params['port']))
+        self.conn = get_client(params['host'], int(params['port']), params['max_pool_size'])
         self.db = self.conn[params['db_name']]
 
-    def __del__(self):
-        self.conn.disconnect()
-        self.conn = None
-        self.db = None
-        self.repo_path = None
-        self.hasRepo = None
-
     def get_booklist(self):
-        return [BookMeta(meta_info) for meta_info in self.db.book.find()]
+        fields = dict(BOOK_FIELDS, _id=0)
+        return [BookMeta(meta_info) for meta_info in self.db.book.find({}, fields)]
+
+    def get_bookpager(self):
+        """lazily paged book list, see BookPager"""
+        return BookPager(self, settings.page_size, settings.page_cache)
+
+    def count_books(self):
+        return self.db.book.count()
 
     def update_meta(self, md5, setter, upsert=False):
         self.db.book.update({'md5': md5}, setter, upsert)
@@ -74,6 +117,40 @@ class MediaRepo:
         self.update_history(md5, setter, True)
         return 1
 
+    def get_book_sizes(self):
+        """set of sizes in bytes of all books"""
+        return set(self.db.book.distinct('bytes'))
+
+    def get_fingerprints(self, path_prefix=''):
+        """map path -> (bytes, mtime, inode, md5) of files hashed before
+
+        only path_prefix and paths under it are loaded.
+        """
+        self.db.fingerprint.ensure_index('path', unique=True)
+        query = {'path': {'$regex': path_regex(path_prefix)}} if path_prefix else {}
+        return {doc['path']: (doc['bytes'], doc['mtime'], doc['inode'], doc['md5'])
+                for doc in self.db.fingerprint.find(query, {'_id': 0})}
+
+    def update_fingerprint(self, srcPath, fingerprint, md5):
+        """remember md5 of srcPath while its (size, mtime, inode) is unchanged
+
+        """
+        size, mtime, inode = fingerprint
+        setter = {"$set": {'bytes': size, 'mtime': mtime, 'inode': inode, 'md5': md5}}
+        self.db.fingerprint.update({'path': srcPath}, setter, True)
+        return 1
+
+    def invalidate_fingerprints(self, path_prefix=''):
+        """forget cached md5 of files under path_prefix, or all of them
+
+        """
+        query = {'path': {'$regex': path_regex(path_prefix)}} if path_prefix else {}
+        self.db.fingerprint.remove(query)
+
+    def bulk_writer(self, on_flush=None, on_stored=None):
+        """BulkWriter for scan results, sized by settings"""
+        return BulkWriter(self, settings.bulk_size, settings.bulk_interval, on_flush, on_stored)
+
     def add_file(self, srcPath, metaInfo):
         filename = metaInfo['md5'] + metaInfo['ext']
         dstfile = os.path.join(self.repo_path, filename)
@@ -84,33 +161,251 @@ class MediaRepo:
                 print 'error'
 
 
-class BookMeta:
+class BulkWriter:
+    """write scan results to database in batches
+
+    results are coalesced per md5 / path into unordered bulk upserts, one
+    round trip per collection and batch. a batch is written once it holds
+    batch_size results, or by a timer flush_interval seconds after its
+    first result. on_flush(count, seconds) is called after each batch,
+    with the time taken by the db writes, and on_stored(metaInfo) for each
+    result of the batch, once it is in db. batches are written one at a
+    time; an error of a timed write is raised by the next add() or close().
+    """
+
+    def __init__(self, repo, batch_size=500, flush_interval=2.0, on_flush=None, on_stored=None):
+        self.repo = repo
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.on_stored = on_stored
+        self.pending = []
+        self.latencies = []  # (count, seconds) of each batch
+        self.timer = None  # flushes the pending batch
+        self.lock = threading.Lock()
+        self.flushing = threading.Lock()  # held while a batch is written
+        self.error = None  # exc_info of a failed timed flush
+
+    def add(self, srcPath, metaInfo, fingerprint=None):
+        """queue a scan result, same arguments as frame_scan handlers"""
+        self.raise_error()
+        with self.lock:
+            self.pending.append((srcPath, metaInfo, fingerprint))
+            if len(self.pending) < self.batch_size:
+                if self.timer is None:
+                    self.timer = threading.Timer(self.flush_interval, self.timed_flush)
+                    self.timer.daemon = True
+                    self.timer.start()
+                return 1
+        self.flush()
+        return 1
+
+    def flush(self):
+        with self.flushing:
+            with self.lock:
+                batch = self.take_pending()
+            self.write(batch)
+
+    def timed_flush(self):
+        """flush on the timer thread, keeping an error for the scan thread"""
+        try:
+            self.flush()
+        except Exception:
+            self.error = sys.exc_info()
+
+    def raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error[0], error[1], error[2]
+
+    def take_pending(self):
+        """return the pending batch and stop its timer, lock held"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        return batch
+
+    def close(self):
+        """stop the timer and write the pending batch"""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        self.flush()
+        self.raise_error()
+
+    def write(self, batch):
+        if not batch:
+            return
+        books, paths, fingerprints = {}, {}, {}
+        for srcPath, metaInfo, fingerprint in batch:
+            md5 = metaInfo['md5']
+            if md5 not in books:
+                books[md5] = (dict(metaInfo), set())
+                del books[md5][0]['rawname']
+            books[md5][1].update(metaInfo['rawname'])
+            paths.setdefault(md5, set()).add(srcPath)
+            if fingerprint is not None:
+                fingerprints[srcPath] = (fingerprint, md5)
+            self.repo.add_file(srcPath, metaInfo)
+
+        start = time.time()
+        db = self.repo.db
+        bulk = db.book.initialize_unordered_bulk_op()
+        for md5, (meta, rawnames) in books.iteritems():
+            bulk.find({'md5': md5}).upsert().update({
+                "$set": meta,
+                "$addToSet": {"rawname": {"$each": list(rawnames)}}})
+        bulk.execute()
+
+        bulk = db.history.initialize_unordered_bulk_op()
+        for md5, srcPaths in paths.iteritems():
+            bulk.find({'md5': md5}).upsert().update({
+                "$set": {'md5': md5},
+                "$addToSet": {"path": {"$each": list(srcPaths)}}})
+        bulk.execute()
+
+        if fingerprints:
+            bulk = db.fingerprint.initialize_unordered_bulk_op()
+            for srcPath, ((size, mtime, inode), md5) in fingerprints.iteritems():
+                bulk.find({'path': srcPath}).upsert().update({"$set": {
+                    'bytes': size, 'mtime': mtime, 'inode': inode, 'md5': md5}})
+            bulk.execute()
+
+        seconds = time.time() - start
+        self.latencies.append((len(batch), seconds))
+        if self.on_flush is not None:
+            self.on_flush(len(batch), seconds)
+        if self.on_stored is not None:
+            for srcPath, metaInfo, fingerprint in batch:
+                self.on_stored(metaInfo)
+
+
+class BookPager:
+    """read-only sequence of BookMeta, loaded a page at a time
+
+    only BOOK_FIELDS are fetched, in _id order, together with the next
+    `prefetch` pages. the latest `cache_pages` pages are kept (LRU).
+    `pager.__getitem__` is a valid objectGetter for a virtual ObjectListView.
+    """
+
+    def __init__(self, repo, page_size=200, cache_pages=50, prefetch=1):
+        self.repo = repo
+        self.page_size = page_size
+        self.cache_pages = cache_pages
+        self.prefetch = prefetch
+        self.set_query({})
+
+    def set_query(self, query):
+        """show only books matching the mongo query"""
+        self.query = query
+        self.count = None
+        self.pages = collections.OrderedDict()
+        self.last_ids = {}  # page -> last _id, to seek instead of skip
+
+    def search(self, text):
+        """show only books with text in title, raw name, language or md5"""
+        if not text:
+            return self.set_query({})
+        pattern = {'$regex': re.escape(text), '$options': 'i'}
+        self.set_query({'$or': [{field: pattern} for field in
+                                ('dispname', 'rawname', 'language', 'md5')]})
+
+    def searched(self, text):
+        """new pager of the books matching text, see search()
+
+        it is counted and its first pages are loaded here, so this may be
+        called off the UI thread to keep those queries from blocking it.
+        """
+        pager = BookPager(self.repo, self.page_size, self.cache_pages, self.prefetch)
+        pager.search(text)
+        if len(pager):
+            pager.fetch(0)
+        return pager
+
+    def __len__(self):
+        if self.count is None:
+            self.count = self.repo.db.book.find(self.query).count()
+        return self.count
+
+    def __getitem__(self, index):
+        page, offset = divmod(index, self.page_size)
+        rows = self.pages.pop(page, None)
+        if rows is None:
+            self.fetch(page)
+            rows = self.pages.pop(page, [])
+        self.pages[page] = rows  # most recently used last
+        return rows[offset] if offset < len(rows) else None
+
+    def fetch(self, page):
+        query = self.query
+        if page - 1 in self.last_ids:
+            query = {'$and': [query, {'_id': {'$gt': self.last_ids[page - 1]}}]}
+            skip = 0
+        else:
+            skip = page * self.page_size
+        fields = dict(BOOK_FIELDS, _id=1)
+        cursor = self.repo.db.book.find(query, fields).sort('_id', 1)
+        docs = list(cursor.skip(skip).limit(self.page_size * (1 + self.prefetch)))
+
+        for i in range(0, len(docs), self.page_size):
+            chunk = docs[i:i + self.page_size]
+            self.last_ids[page] = chunk[-1]['_id']
+            self.pages.pop(page, None)
+            self.pages[page] = [BookMeta(doc) for doc in chunk]
+            page += 1
+        while len(self.pages) > self.cache_pages:
+            self.pages.popitem(last=False)
+
+
+class BookMeta(object):
     """Meta info of a single book
 
+    Only the fields shown in the book list are kept, the full db document
+    is fetched on demand through `meta`.
+
     """
+    __slots__ = ('md5', 'ext', 'bytes', 'language', 'dispname', 'rawname')
 
     def __init__(self, meta):
-        self.meta = meta
-        self.md5 = meta['md5']
-        self.ext = meta['ext']
+        self.md5 = str(meta['md5'])  # hex digest, ascii
+        self.ext = _shared(meta['ext'])
+        self.bytes = meta.get('bytes', 0)
+        self.language = _shared(meta.get('language', ''))
+        self.dispname = meta.get('dispname')
+        self.rawname = ','.join(meta['rawname'])
+
+    @property
+    def meta(self):
+        """full db document of this book"""
+        return get_repo().db.book.find_one({'md5': self.md5}, {'_id': 0}) or {}
 
     def get_filename(self):
         return self.md5+self.ext
 
     def get_dispname(self):
-        return self.meta.get('dispname', ','.join(self.meta['rawname']))
+        return self.rawname if self.dispname is None else self.dispname
 
     def set_dispname(self, dispname):
-        self.meta['dispname'] = dispname
-        MediaRepo().update_meta(self.md5, {"$set": {"dispname": dispname}})
+        self.dispname = dispname
+        get_repo().update_meta(self.md5, {"$set": {"dispname": dispname}})
 
     def getSizeString(self):
-        return util.getSizeInNiceString(self.meta.get('bytes', 0))
+        return util.getSizeInNiceString(self.bytes)
 
     def get_book_language(self):
-        return self.meta.get('language', '')
+        return self.language
+
+
+_shared_values = {}
+
+
+def _shared(value):
+    """one copy of values repeated by many books, like ext and language"""
+    return _shared_values.setdefault(value, value)
 
 
 if __name__ == '__main__':
-    repo = MediaRepo()
+    repo = get_repo()
     print repo.get_booklist()[0:2]
@@ -4,11 +4,52 @@ REPO_PATH = None
 host = "localhost"
 port = 27017
 db_name = 'bookhub'
+max_pool_size = 10  # connections shared by UI and scan threads
+
+# libraries bigger than this are listed lazily, page_size books at a time
+lazy_booklist_min = 50000
+page_size = 200
+page_cache = 50  # pages kept in memory
+
+# smaller libraries are listed virtually, only the rows on screen are
+# drawn and the text of the latest row_cache rows is kept. set
+# fast_booklist to False to list every book in a plain list instead
+fast_booklist = True
+row_cache = 2000
+
+# search box: wait search_delay ms after the last keystroke, then search
+# search_chunk books at a time on a worker thread
+search_delay = 150
+search_chunk = 5000
+
+# books found by a scan are added to the overview in batches, at least
+# live_period_min seconds apart, and further apart if adding them takes
+# more than live_frame_budget of the UI's time. at most live_queue_size
+# books wait to be listed, the list is reloaded from db if more are found
+live_queue_size = 20000
+live_frame_budget = 0.1
+live_period_min = 0.25
+live_period_max = 5.0
 
 # scan configs
 ignore_seq = {'.git', '.svn', 'log', 'logs'}
 ext_pool = '.pdf'
 ignore_hidden = True
+force_rehash = False  # ignore md5 cached by (path, size, mtime, inode)
+
+# scan results are written in batches of bulk_size, or bulk_interval seconds after the first one
+bulk_size = 500
+bulk_interval = 2.0
+
+# hashing pipeline. hash_workers <= 1 hashes serially on the scan thread
+hash_workers = 4
+hash_pool = 'thread'  # 'thread' or 'process'
+scan_queue_size = 256
+
+# size-first dedupe: hash files that may duplicate another one, by size,
+# first on the hash_workers; defer_hash lists the others before hashing
+size_first = False
+defer_hash = False
 
 try:
     from local_settings import *
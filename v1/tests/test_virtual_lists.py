@@ -0,0 +1,36 @@
+# -*- coding: utf-8-*-
+"""virtual lists can be built, with and without an object getter
+
+run from v1: python -m unittest discover tests
+"""
+import unittest
+import wx
+from lib.ObjectListView import VirtualObjectListView, FastObjectListView, GroupListView
+from frame_overview import BookListView
+
+
+class VirtualListsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = wx.App(False)
+
+    def setUp(self):
+        self.frame = wx.Frame(None)
+
+    def tearDown(self):
+        self.frame.Destroy()
+
+    def test_construct(self):
+        for cls in (VirtualObjectListView, FastObjectListView, GroupListView, BookListView):
+            olv = cls(self.frame, -1)
+            self.assertEqual(olv.GetItemCount(), 0)
+
+    def test_getter(self):
+        olv = VirtualObjectListView(self.frame, -1, getter=lambda index: index)
+        olv.SetItemCount(3)
+        self.assertEqual(olv.GetObjectAt(2), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()